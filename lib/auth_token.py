@@ -0,0 +1,37 @@
+import os
+import secrets
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+# Signed tokens handed out by /verify-otp, proving the holder owns a phone number.
+# Every service that checks them needs the same AUTH_SECRET; without it a random secret is
+# used, which only works while otp.py and the checking service share a process (the gateway).
+TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', str(30 * 86400)))
+
+_secret = os.getenv('AUTH_SECRET')
+if not _secret:
+    print("AUTH_SECRET is not set, tokens will only be valid in this process")
+    _secret = secrets.token_hex(32)
+
+_serializer = URLSafeTimedSerializer(_secret, salt='phone-auth')
+
+
+def issue_token(phone_number):
+    return _serializer.dumps({'phone_number': phone_number})
+
+
+def verify_token(token, max_age=None):
+    # Phone number the token was issued for, or None if it is forged, malformed or expired
+    try:
+        payload = _serializer.loads(token, max_age=TOKEN_TTL if max_age is None else max_age)
+    except (BadSignature, SignatureExpired):
+        return None
+    return payload.get('phone_number') if isinstance(payload, dict) else None
+
+
+def request_phone_number(request):
+    # Verified phone number from an "Authorization: Bearer <token>" header, or None
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return verify_token(token.strip())
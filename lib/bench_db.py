@@ -0,0 +1,172 @@
+# Read/write throughput of location_data under mixed concurrent load.
+# Compares the old access pattern (new connection per request, rollback journal,
+# SELECT then INSERT/UPDATE) with the db.py layer (per-thread WAL connections and
+# a batched write queue).
+#
+#   python bench_db.py --writers 4 --readers 8 --seconds 5
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db
+from safe_data import init_db
+
+
+def legacy_connection(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def legacy_write(db_path, params):
+    latitude, longitude, time_, safety_score, report, image_path = params
+    conn = legacy_connection(db_path)
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM location_data WHERE latitude = ? AND longitude = ? AND time = ?',
+                   (latitude, longitude, time_))
+    if cursor.fetchone():
+        cursor.execute('''
+            UPDATE location_data SET safety_score = ?, report = ?, image_path = ?
+            WHERE latitude = ? AND longitude = ? AND time = ?
+        ''', (safety_score, report, image_path, latitude, longitude, time_))
+    else:
+        cursor.execute('''
+            INSERT INTO location_data (latitude, longitude, time, safety_score, report, image_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', params)
+    conn.commit()
+    conn.close()
+
+
+def legacy_read(db_path):
+    conn = legacy_connection(db_path)
+    rows = conn.execute('SELECT * FROM location_data ORDER BY id DESC LIMIT 100').fetchall()
+    conn.close()
+    return rows
+
+
+def pooled_read(db_path):
+    return db.get_connection(db_path).execute('SELECT * FROM location_data ORDER BY id DESC LIMIT 100').fetchall()
+
+
+def random_row(rng):
+    # Small coordinate grid so a share of the writes hit existing rows and update them
+    return (
+        round(12.9 + rng.randint(0, 200) * 0.001, 4),
+        round(77.5 + rng.randint(0, 200) * 0.001, 4),
+        f"2025-01-16T{rng.randint(0, 23):02d}:00:00",
+        rng.uniform(0, 10),
+        'report ' * 50,
+        'uploads/bench.jpg',
+    )
+
+
+def run(mode, writers, readers, seconds, seed_rows):
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        if mode == 'legacy':
+            conn = legacy_connection(db_path)
+            conn.execute('''
+                CREATE TABLE location_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    time TEXT NOT NULL,
+                    safety_score REAL NOT NULL,
+                    report TEXT NOT NULL,
+                    image_path TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+            conn.close()
+        else:
+            init_db(db_path)
+
+        rng = random.Random(42)
+        seed_conn = sqlite3.connect(db_path)
+        seed_conn.executemany('''
+            INSERT OR IGNORE INTO location_data (latitude, longitude, time, safety_score, report, image_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [random_row(rng) for _ in range(seed_rows)])
+        seed_conn.commit()
+        seed_conn.close()
+
+        write_queue = db.WriteQueue(db_path) if mode == 'pooled' else None
+        counts = {'read': 0, 'write': 0, 'error': 0}
+        counts_lock = threading.Lock()
+        stop = threading.Event()
+
+        def writer(worker_id):
+            rng = random.Random(worker_id)
+            done = 0
+            while not stop.is_set():
+                params = random_row(rng)
+                try:
+                    if write_queue is not None:
+                        write_queue.upsert_location(*params).result()
+                    else:
+                        legacy_write(db_path, params)
+                    done += 1
+                except sqlite3.OperationalError:
+                    with counts_lock:
+                        counts['error'] += 1
+            with counts_lock:
+                counts['write'] += done
+
+        def reader():
+            done = 0
+            while not stop.is_set():
+                try:
+                    if mode == 'pooled':
+                        pooled_read(db_path)
+                    else:
+                        legacy_read(db_path)
+                    done += 1
+                except sqlite3.OperationalError:
+                    with counts_lock:
+                        counts['error'] += 1
+            if mode == 'pooled':
+                db.close_connection(db_path)
+            with counts_lock:
+                counts['read'] += done
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if write_queue is not None:
+            write_queue.close()
+        db.close_connection(db_path)
+
+        return counts['read'] / elapsed, counts['write'] / elapsed, counts['error']
+    finally:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--seed-rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds}s per mode, {args.seed_rows} seed rows")
+    for mode in ('legacy', 'pooled'):
+        reads, writes, errors = run(mode, args.writers, args.readers, args.seconds, args.seed_rows)
+        print(f"{mode:>7}: {reads:10.1f} reads/s  {writes:10.1f} writes/s  {errors} errors")
@@ -0,0 +1,103 @@
+# Requests per second through the gateway, served by waitress, against the Werkzeug
+# development server that app.run() starts for each service. Report generation and
+# Twilio are replaced by local stand-ins so only the serving stack is measured.
+#
+#   python bench_gateway.py --concurrency 32 --requests 2000 --report-latency 0.05
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('REPORT_BACKEND', 'fake')
+os.environ.setdefault('DISPATCH_PROVIDER', 'fake')
+
+# Mix of light read, model and slow upstream calls
+ROUTES = [
+    ('GET', '/safety/get_safety_data?limit=50', None),
+    ('POST', '/recom/recommend', {'avg_distance': 5.0, 'travel_time': 20, 'risk_score': 3}),
+    ('POST', '/symptoms/predict', {'symptoms': ['itching', 'skin_rash']}),
+    ('POST', '/report/generate-report',
+     {'user_input': 'bag snatched', 'location': 'MG Road', 'time': '21:00', 'date': '2024-05-01'}),
+]
+
+
+def start_dev_server(app):
+    # What app.run() does, minus the debugger and reloader
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_waitress(app, threads):
+    from waitress.server import create_server
+    server = create_server(app, host='127.0.0.1', port=0, threads=threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    return server.effective_port, server.close
+
+
+def call(base_url, method, path, body):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def drive(port, concurrency, total):
+    base_url = f'http://127.0.0.1:{port}'
+    # Warm every route once so model loading is not timed
+    for route in ROUTES:
+        call(base_url, *route)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda i: call(base_url, *ROUTES[i % len(ROUTES)]), range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16, help="waitress worker threads")
+    parser.add_argument('--report-latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    os.environ.setdefault('FAKE_REPORT_LATENCY', str(args.report_latency))
+    # Generated reports are cached by prompt; keep every request going to the backend
+    os.environ.setdefault('REPORT_CACHE_SIZE', '0')
+
+    # Per-request access logs and queue-depth warnings would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+    from gateway import app
+
+    servers = [('werkzeug dev server', lambda: start_dev_server(app))]
+    try:
+        import waitress  # noqa: F401
+        servers.append((f'waitress ({args.threads} threads)', lambda: start_waitress(app, args.threads)))
+    except ImportError:
+        print("waitress is not installed, only the development server is measured")
+
+    for name, start in servers:
+        port, stop = start()
+        result = drive(port, args.concurrency, args.requests)
+        stop()
+        print(f"{name:<24} {result['rps']:8.1f} req/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms")
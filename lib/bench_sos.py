@@ -0,0 +1,103 @@
+# Time from an SOS to its first (and last) delivered contact, against a local Twilio stand-in.
+# Compares the fan-out engine (all contacts at once through the dispatch queue, ahead of OTP
+# traffic) with sending to each contact one after the other inside the request.
+#
+#   python bench_sos.py --contacts 5 --alerts 50 --latency 0.2 --otp-backlog 20
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from dispatch import PRIORITY_OTP, DispatchQueue, FakeProvider
+from sos_fanout import SosFanout
+
+
+class JitteryProvider(FakeProvider):
+    # Provider round-trips vary; +-50% around the mean latency
+    def __init__(self, mean_latency):
+        super().__init__()
+        self.mean_latency = mean_latency
+
+    def _send(self, kind, to, **payload):
+        time.sleep(self.mean_latency * random.uniform(0.5, 1.5))
+        return super()._send(kind, to, **payload)
+
+
+def wait_until_done(fanout, alert_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = fanout.status(alert_id)
+        if status['pending'] == 0:
+            return status
+        time.sleep(0.005)
+    raise TimeoutError(f"SOS {alert_id} not delivered after {timeout}s")
+
+
+def run_fanout(args, db_path):
+    provider = JitteryProvider(args.latency)
+    dispatcher = DispatchQueue(provider, workers=args.workers)
+    fanout = SosFanout(dispatcher, db_path=db_path, twiml_url='http://localhost/twiml')
+    fanout.set_contacts('bench', [{'phone_number': f'+1555000{i:04d}'} for i in range(args.contacts)])
+
+    first, last = [], []
+    for _ in range(args.alerts):
+        # OTP traffic already waiting in the queue when the SOS arrives
+        for i in range(args.otp_backlog):
+            dispatcher.send_sms(f'+1666000{i:04d}', 'Your OTP code is 123456', priority=PRIORITY_OTP)
+
+        start = time.time()
+        status = wait_until_done(fanout, fanout.trigger('bench', 12.9716, 77.5946))
+        sent_at = [delivery['updated_at'] for delivery in status['deliveries'] if delivery['status'] == 'sent']
+        first.append(min(sent_at) - start)
+        last.append(max(sent_at) - start)
+    dispatcher.close()
+    return first, last
+
+
+def run_sequential(args):
+    provider = JitteryProvider(args.latency)
+    contacts = [f'+1555000{i:04d}' for i in range(args.contacts)]
+
+    first, last = [], []
+    for _ in range(args.alerts):
+        start = time.time()
+        sent_at = []
+        for number in contacts:
+            provider.send_sms(number, 'SOS!')
+            sent_at.append(time.time())
+            provider.make_call(number, 'http://localhost/twiml')
+            sent_at.append(time.time())
+        first.append(min(sent_at) - start)
+        last.append(max(sent_at) - start)
+    return first, last
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--contacts', type=int, default=5)
+    parser.add_argument('--alerts', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.2, help='Mean fake provider round-trip in seconds')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--otp-backlog', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        results = {
+            'sequential': run_sequential(args),
+            'fan-out': run_fanout(args, db_path),
+        }
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print(f"{args.contacts} contacts, {args.alerts} alerts, {args.latency * 1000:.0f} ms provider latency, "
+          f"{args.otp_backlog} queued OTPs per alert")
+    for name, (first, last) in results.items():
+        print(f"{name:>10}: median time to first contact {statistics.median(first) * 1000:7.1f} ms, "
+              f"to all contacts {statistics.median(last) * 1000:7.1f} ms")
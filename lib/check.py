@@ -1,13 +1,47 @@
+# Smoke test and load benchmark for the backend.
+#
+#   python check.py smoke --url http://192.168.131.199:5000 --image photo.jpeg
+#   python check.py bench --offline --requests 200 --concurrency 16 --save-baseline baseline.json
+#   python check.py bench --offline --baseline baseline.json
+#   python check.py bench --url http://localhost:5000 --routes predict,recommend
+#
+# bench drives each route through the gateway prefixes (see gateway.py) and prints p50/p95/p99
+# latency and throughput. With --offline the gateway is started in this process inside a
+# scratch directory, with a stub scorer and report model in place of a.py and fake Twilio,
+# so nothing leaves the machine. --baseline compares against a file written by
+# --save-baseline and exits 1 when a route got slower by more than --tolerance.
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 # URL of the Flask API
-BASE_URL = 'http://192.168.131.199:5000'
+BASE_URL = os.getenv('CHECK_URL', 'http://192.168.131.199:5000')
+
+LIB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Phone number whose emergency contacts the sos route alerts
+BENCH_USER = '+15550000000'
+# Authorization header for BENCH_USER, filled in by bench() before the sos route runs
+BENCH_AUTH = {}
 
 # Function to test uploading an image
-def test_upload_image():
-    url = f"{BASE_URL}/upload_image"
+def test_upload_image(base_url=BASE_URL, image_path=None):
+    url = f"{base_url}/upload_image"
     # Define the image file path (use an existing image file on your system)
-    image_path = r"C:\Users\mukes\OneDrive\Documents\GenAI x Gender Tech Hackathon\YOLO_traffic\images.jpeg"
+    image_path = image_path or os.getenv('CHECK_IMAGE', 'images.jpeg')
 
     # Prepare the data to send in the request
     data = {
@@ -16,12 +50,9 @@ def test_upload_image():
         'time': '2025-01-16T12:00:00'  # Example timestamp
     }
 
-    files = {
-        'file': open(image_path, 'rb')  # Open the image file in binary mode
-    }
-
-    # Send the POST request
-    response = requests.post(url, data=data, files=files)
+    with open(image_path, 'rb') as image:
+        # Send the POST request
+        response = requests.post(url, data=data, files={'file': image})
 
     # Check the response
     if response.status_code == 200:
@@ -29,12 +60,9 @@ def test_upload_image():
     else:
         print(f"Failed to upload image: {response.status_code}, {response.json()}")
 
-    # Close the file
-    files['file'].close()
-
 # Function to test fetching safety data
-def test_get_safety_data():
-    url = f"{BASE_URL}/get_safety_data"
+def test_get_safety_data(base_url=BASE_URL):
+    url = f"{base_url}/get_safety_data"
 
     # Send the GET request to fetch the stored safety data
     response = requests.get(url)
@@ -45,7 +73,255 @@ def test_get_safety_data():
     else:
         print(f"Failed to fetch safety data: {response.status_code}, {response.json()}")
 
+
+# ---- Offline stand-ins ----
+
+def install_stub_models(score_latency, report_latency):
+    # Replaces a.py so /upload_image never calls the real scorer or Gemini
+    stub = types.ModuleType('a')
+
+    def calculate_safety_score(image_path):
+        time.sleep(score_latency)
+        return round(random.Random(image_path).uniform(0, 10), 2)
+
+    def send_to_gemini_model(image_path):
+        time.sleep(report_latency)
+        return f"Stub report for {os.path.basename(image_path)}"
+
+    def stream_gemini_model(image_path):
+        for word in send_to_gemini_model(image_path).split(' '):
+            yield word + ' '
+
+    stub.calculate_safety_score = calculate_safety_score
+    stub.send_to_gemini_model = send_to_gemini_model
+    stub.stream_gemini_model = stream_gemini_model
+    sys.modules['a'] = stub
+
+
+def start_offline_gateway(args):
+    # Fresh databases, uploads and model artifacts in a scratch directory
+    workdir = tempfile.mkdtemp(prefix='check-')
+    os.chdir(workdir)
+    os.environ.setdefault('RECOM_DATA', os.path.join(LIB_DIR, 'user_data.csv'))
+    os.environ['SYMPTOM_BUNDLE'] = os.path.join(workdir, 'models', 'symptom_bundle.joblib')
+    os.environ['DISPATCH_PROVIDER'] = 'fake'
+    os.environ['FAKE_PROVIDER_LATENCY'] = str(args.twilio_latency)
+    os.environ['REPORT_BACKEND'] = 'fake'
+    install_stub_models(args.score_latency, args.report_latency)
+
+    sys.path.insert(0, LIB_DIR)
+    from waitress.server import create_server
+    from gateway import app
+
+    server = create_server(app, host='127.0.0.1', port=0, threads=args.threads)
+    threading.Thread(target=server.run, daemon=True).start()
+    print(f"Offline gateway on port {server.effective_port}, data in {workdir}")
+    return f'http://127.0.0.1:{server.effective_port}'
+
+
+# ---- Load generation ----
+
+def make_image(seed):
+    # A small JPEG that differs per request, so uploads are not served from the score cache
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + random.Random(seed).randbytes(16 * 1024) + b'\xff\xd9'
+    rng = random.Random(seed)
+    image = Image.new('RGB', (320, 240), tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def upload_image(session, base_url, i):
+    return session.post(f'{base_url}/safety/upload_image', files={'file': (f'bench{i}.jpg', make_image(i))}, data={
+        'latitude': str(12.9 + random.random() * 0.2),
+        'longitude': str(77.5 + random.random() * 0.2),
+        'time': '2025-01-16T12:00:00',
+    })
+
+
+def get_safety_data(session, base_url, i):
+    return session.get(f'{base_url}/safety/get_safety_data', params={
+        'latitude': 12.97, 'longitude': 77.59, 'radius': 5000, 'limit': 100,
+    })
+
+
+def recommend(session, base_url, i):
+    return session.post(f'{base_url}/recom/recommend', json={
+        'avg_distance': random.uniform(0.5, 20), 'travel_time': random.randint(5, 90), 'risk_score': random.randint(1, 10),
+    })
+
+
+def predict(session, base_url, i):
+    return session.post(f'{base_url}/symptoms/predict', json={
+        'symptoms': random.sample(['itching', 'skin_rash', 'chills', 'vomiting', 'fatigue', 'cough', 'headache'], 3),
+    })
+
+
+def send_otp(session, base_url, i):
+    # One number per request, otherwise the per-phone send limit answers 429
+    return session.post(f'{base_url}/otp/send-otp', json={'phoneNumber': f'+1555{i:07d}'})
+
+
+def sos(session, base_url, i):
+    return session.post(f'{base_url}/emergency/sos', json={'user_id': BENCH_USER, 'latitude': 12.97, 'longitude': 77.59},
+                        headers=BENCH_AUTH)
+
+
+def prepare_sos(session, base_url, token):
+    # Editing contacts and raising an SOS both need the token /verify-otp issues for BENCH_USER
+    BENCH_AUTH['Authorization'] = f'Bearer {token}'
+    contacts = [{'phone_number': f'+1666000{i:04d}', 'name': f'Contact {i}'} for i in range(3)]
+    session.put(f'{base_url}/emergency/contacts/{BENCH_USER}', json={'contacts': contacts},
+                headers=BENCH_AUTH).raise_for_status()
+
+
+ROUTES = {
+    'upload_image': upload_image,
+    'get_safety_data': get_safety_data,
+    'recommend': recommend,
+    'predict': predict,
+    'send_otp': send_otp,
+    'sos': sos,
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def run_route(base_url, name, total, concurrency, counter):
+    call = ROUTES[name]
+    local = threading.local()
+
+    def one(_):
+        # requests.Session is not thread-safe, keep one per worker
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            ok = call(local.session, base_url, next(counter)).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests': total,
+        'errors': sum(1 for _, ok in results if not ok),
+        'rps': total / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # A route regresses when p95 grows or throughput drops by more than tolerance
+    regressions = []
+    print(f"\n{'route':<16} {'p95 ms':>9} {'baseline':>9} {'change':>8} {'req/s':>8} {'baseline':>9} {'change':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<16} {result['p95_ms']:9.1f} {'-':>9} {'':>8} {result['rps']:8.1f} {'-':>9}")
+            continue
+        p95_change = result['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        rps_change = result['rps'] / base['rps'] - 1 if base['rps'] else 0.0
+        slower = p95_change > tolerance or rps_change < -tolerance
+        if slower:
+            regressions.append(name)
+        print(f"{name:<16} {result['p95_ms']:9.1f} {base['p95_ms']:9.1f} {p95_change:+8.0%} "
+              f"{result['rps']:8.1f} {base['rps']:9.1f} {rps_change:+8.0%}{'  REGRESSED' if slower else ''}")
+    return regressions
+
+
+def bench(args):
+    base_url = start_offline_gateway(args) if args.offline else args.url.rstrip('/')
+    names = args.routes.split(',') if args.routes else list(ROUTES)
+    unknown = [name for name in names if name not in ROUTES]
+    if unknown:
+        sys.exit(f"Unknown routes: {', '.join(unknown)} (choose from {', '.join(ROUTES)})")
+
+    if 'sos' in names:
+        token = args.token
+        if token is None and args.offline:
+            # Same process and secret as the gateway, so no SMS round trip is needed
+            from auth_token import issue_token
+            token = issue_token(BENCH_USER)
+        if token is None:
+            sys.exit(f"The sos route needs --token: the /verify-otp token for {BENCH_USER}")
+        prepare_sos(requests.Session(), base_url, token)
+
+    counter = itertools.count(random.randrange(10 ** 6))
+    results = {}
+    for name in names:
+        # The services print every request; keep the report readable
+        with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+            run_route(base_url, name, max(1, args.requests // 10), args.concurrency, counter)  # warm up
+            results[name] = run_route(base_url, name, args.requests, args.concurrency, counter)
+
+    print(f"\n{'route':<16} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in results.items():
+        print(f"{name:<16} {result['rps']:8.1f} {result['p50_ms']:9.1f} {result['p95_ms']:9.1f} "
+              f"{result['p99_ms']:9.1f} {result['errors']:7d}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'routes': results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('concurrency') != args.concurrency:
+            print(f"\nBaseline was recorded at concurrency {baseline.get('concurrency')}, not {args.concurrency}")
+        regressions = compare(results, baseline['routes'], args.tolerance)
+        if regressions:
+            print(f"\nSlower than baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+    if any(result['errors'] for result in results.values()):
+        sys.exit(1)
+
+
 # Run the tests
 if __name__ == '__main__':
-    test_upload_image()  # Test image upload
-    test_get_safety_data()  # Test fetching safety data
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command')
+
+    smoke_parser = commands.add_parser('smoke', help="upload one image and fetch the safety data")
+    smoke_parser.add_argument('--url', default=BASE_URL)
+    smoke_parser.add_argument('--image', help="image to upload (default: $CHECK_IMAGE or images.jpeg)")
+
+    bench_parser = commands.add_parser('bench', help="load test every route through the gateway")
+    bench_parser.add_argument('--url', default=os.getenv('CHECK_URL', 'http://localhost:5000'), help="running gateway")
+    bench_parser.add_argument('--offline', action='store_true', help="start the gateway here with stub models and fake Twilio")
+    bench_parser.add_argument('--token', default=os.getenv('CHECK_TOKEN'),
+                              help=f"/verify-otp token for {BENCH_USER}, to set up its contacts for sos")
+    bench_parser.add_argument('--routes', help=f"comma-separated subset of {','.join(ROUTES)}")
+    bench_parser.add_argument('--requests', type=int, default=200, help="requests per route")
+    bench_parser.add_argument('--concurrency', type=int, default=16)
+    bench_parser.add_argument('--threads', type=int, default=16, help="gateway worker threads (--offline)")
+    bench_parser.add_argument('--score-latency', type=float, default=0.05, help="stub scorer seconds (--offline)")
+    bench_parser.add_argument('--report-latency', type=float, default=0.2, help="stub Gemini seconds (--offline)")
+    bench_parser.add_argument('--twilio-latency', type=float, default=0.1, help="fake Twilio seconds (--offline)")
+    bench_parser.add_argument('--baseline', help="compare against this baseline file")
+    bench_parser.add_argument('--save-baseline', help="write the results to this file")
+    bench_parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    bench_parser.add_argument('--verbose', action='store_true', help="show the services' own output")
+
+    args = parser.parse_args()
+    if args.command == 'bench':
+        bench(args)
+    else:
+        test_upload_image(args.url if args.command else BASE_URL, getattr(args, 'image', None))  # Test image upload
+        test_get_safety_data(args.url if args.command else BASE_URL)  # Test fetching safety data
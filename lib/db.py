@@ -0,0 +1,160 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+import metrics
+
+# Shared SQLite access for the safety services: one connection per thread, WAL journaling
+# so readers are not blocked by uploads, and a background queue that batches writes.
+
+DB_PATH = os.getenv('SAFETY_DB', 'safety_data.db')
+
+# hour_of_day of rows whose time text is not a timestamp; queries skip them through time_epoch IS NULL
+UNPARSED_HOUR = -1
+
+UPSERT_LOCATION_SQL = '''
+    INSERT INTO location_data (latitude, longitude, time, safety_score, report, image_path, thumbnail_path,
+                               time_epoch, hour_of_day)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (latitude, longitude, time) DO UPDATE SET
+        safety_score = excluded.safety_score,
+        report = excluded.report,
+        image_path = excluded.image_path,
+        thumbnail_path = excluded.thumbnail_path
+'''
+
+_local = threading.local()
+
+
+def connect(db_path=None):
+    # Open a new connection with the pragmas every service connection should have
+    conn = sqlite3.connect(db_path or DB_PATH, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row  # This allows us to access rows as dictionaries
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')  # Safe with WAL, avoids an fsync per commit
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+def get_connection(db_path=None):
+    # Reuse one connection per thread instead of reconnecting on every request
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect(db_path)
+    return conn
+
+
+def close_connection(db_path=None):
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(db_path or DB_PATH, None)
+    if conn is not None:
+        conn.close()
+
+
+def time_columns(time_text):
+    # (unix epoch seconds, hour of day 0-23) of an ISO-8601 timestamp, or (None, None) if it cannot be parsed.
+    # Timestamps without an offset are taken as UTC; the hour is the wall-clock hour as written.
+    try:
+        moment = datetime.fromisoformat(time_text.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None, None
+    epoch = (moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)).timestamp()
+    return epoch, moment.hour
+
+
+def stored_time_columns(time_text):
+    # time_columns() as written to location_data: a time that cannot be parsed keeps a NULL epoch
+    # but gets UNPARSED_HOUR, so the startup backfill knows it was already tried
+    epoch, hour = time_columns(time_text)
+    return (epoch, hour) if epoch is not None else (None, UNPARSED_HOUR)
+
+
+def location_params(latitude, longitude, time, safety_score, report, image_path, thumbnail_path=None):
+    return (latitude, longitude, time, safety_score, report, image_path, thumbnail_path) + stored_time_columns(time)
+
+
+def upsert_location(conn, latitude, longitude, time, safety_score, report, image_path, thumbnail_path=None):
+    # sqlite3 caches the prepared statement by its SQL text, so this only compiles once per connection
+    conn.execute(UPSERT_LOCATION_SQL,
+                 location_params(latitude, longitude, time, safety_score, report, image_path, thumbnail_path))
+
+
+class WriteQueue:
+    # Funnels writes from all request threads into one writer thread, which commits them in batches.
+    # submit() returns a Future that resolves once the write is committed.
+    def __init__(self, db_path=None, batch_size=256):
+        self.db_path = db_path or DB_PATH
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params):
+        future = Future()
+        self._queue.put((sql, params, future))
+        return future
+
+    def upsert_location(self, latitude, longitude, time, safety_score, report, image_path, thumbnail_path=None):
+        return self.submit(UPSERT_LOCATION_SQL,
+                           location_params(latitude, longitude, time, safety_score, report, image_path, thumbnail_path))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+
+                # Whatever queued up while the last batch was committing goes into the next transaction
+                batch = [item]
+                stop = False
+                while len(batch) < self.batch_size:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                self._write_batch(conn, batch)
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, batch):
+        with metrics.timer('db_upsert', store='sqlite'):
+            self._commit_batch(conn, batch)
+
+    def _commit_batch(self, conn, batch):
+        try:
+            with conn:
+                for sql, params, _ in batch:
+                    conn.execute(sql, params)
+        except Exception:
+            # Retry one by one so a single bad write does not fail the whole batch
+            for sql, params, future in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    future.set_result(None)
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        for _, _, future in batch:
+            future.set_result(None)
@@ -0,0 +1,194 @@
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+import metrics
+
+# Outbound SMS and calls go through one queue served by a pool of worker threads,
+# so requests return without waiting for the provider. SOS messages always go first.
+PRIORITY_SOS = 0
+PRIORITY_OTP = 10
+
+
+class TwilioProvider:
+    # One Twilio client whose HTTP session keeps connections open for all workers
+    def __init__(self, account_sid, auth_token, from_number, pool_size=8, timeout=10):
+        from requests.adapters import HTTPAdapter
+        from twilio.http.http_client import TwilioHttpClient
+        from twilio.rest import Client
+
+        http_client = TwilioHttpClient(pool_connections=True, timeout=timeout)
+        http_client.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.client = Client(account_sid, auth_token, http_client=http_client)
+        self.from_number = from_number
+
+    def send_sms(self, to, body):
+        return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+
+    def make_call(self, to, url):
+        return self.client.calls.create(to=to, from_=self.from_number, url=url).sid
+
+
+class FakeProvider:
+    # Stands in for Twilio in tests and benchmarks: records what would have been sent.
+    # latency delays every send; the first `failures` sends raise to exercise retries.
+    def __init__(self, latency=0.0, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.sent = []
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+
+    def _send(self, kind, to, **payload):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("Fake provider failure")
+            sid = f"FAKE{next(self._counter):06d}"
+            self.sent.append(dict(payload, kind=kind, to=to, sid=sid, sent_at=time.time()))
+        return sid
+
+    def send_sms(self, to, body):
+        return self._send('sms', to, body=body)
+
+    def make_call(self, to, url):
+        return self._send('call', to, url=url)
+
+
+class Dispatch:
+    # One outbound SMS or call and its delivery state
+    def __init__(self, kind, to, priority, payload, on_done=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.to = to
+        self.priority = priority
+        self.payload = payload
+        self.on_done = on_done
+        self.status = 'queued'
+        self.attempts = 0
+        self.sid = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "to": self.to,
+            "status": self.status,
+            "attempts": self.attempts,
+            "sid": self.sid,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class DispatchQueue:
+    def __init__(self, provider, workers=4, max_retries=3, backoff=0.5, max_backoff=30.0):
+        self.provider = provider
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # First in, first out within a priority
+        self._threads = [threading.Thread(target=self._run, name=f'dispatch-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind, to, priority, on_done=None, **payload):
+        dispatch = Dispatch(kind, to, priority, payload, on_done)
+        self._put(dispatch)
+        return dispatch
+
+    def send_sms(self, to, body, priority=PRIORITY_OTP, on_done=None):
+        return self.submit('sms', to, priority, on_done, body=body)
+
+    def make_call(self, to, url, priority=PRIORITY_SOS, on_done=None):
+        return self.submit('call', to, priority, on_done, url=url)
+
+    def _put(self, dispatch):
+        self._queue.put((dispatch.priority, next(self._order), dispatch))
+
+    def _run(self):
+        while True:
+            _, _, dispatch = self._queue.get()
+            if dispatch is None:
+                break
+            self._deliver(dispatch)
+
+    def _deliver(self, dispatch):
+        dispatch.attempts += 1
+        dispatch.status = 'sending'
+        try:
+            with metrics.timer('twilio_call', kind=dispatch.kind):
+                if dispatch.kind == 'sms':
+                    dispatch.sid = self.provider.send_sms(dispatch.to, dispatch.payload['body'])
+                else:
+                    dispatch.sid = self.provider.make_call(dispatch.to, dispatch.payload['url'])
+            dispatch.status = 'sent'
+            dispatch.error = None
+        except Exception as e:
+            dispatch.error = str(e)
+            if dispatch.attempts <= self.max_retries:
+                # Exponential backoff with jitter; the worker moves on to other messages meanwhile
+                delay = min(self.max_backoff, self.backoff * 2 ** (dispatch.attempts - 1))
+                dispatch.status = 'retrying'
+                timer = threading.Timer(delay * random.uniform(0.5, 1.0), self._put, args=(dispatch,))
+                timer.daemon = True
+                timer.start()
+                return
+            print(f"Error sending {dispatch.kind} to {dispatch.to}: {e}")
+            dispatch.status = 'failed'
+
+        dispatch.finished_at = time.time()
+        dispatch.done.set()
+        if dispatch.on_done is not None:
+            try:
+                dispatch.on_done(dispatch)
+            except Exception as e:
+                print(f"Error in dispatch callback: {e}")
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put((float('inf'), next(self._order), None))
+        for thread in self._threads:
+            thread.join()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    # Shared queue for every service in this process.
+    # DISPATCH_PROVIDER=fake swaps Twilio for FakeProvider so everything runs offline.
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            workers = int(os.getenv('DISPATCH_WORKERS', '4'))
+            if os.getenv('DISPATCH_PROVIDER', 'twilio') == 'fake':
+                provider = FakeProvider(latency=float(os.getenv('FAKE_PROVIDER_LATENCY', '0')))
+            else:
+                provider = TwilioProvider(
+                    os.getenv('TWILIO_ACCOUNT_SID'),
+                    os.getenv('TWILIO_AUTH_TOKEN'),
+                    os.getenv('TWILIO_PHONE_NUMBER'),
+                    pool_size=workers,
+                )
+            _dispatcher = DispatchQueue(
+                provider,
+                workers=workers,
+                max_retries=int(os.getenv('DISPATCH_MAX_RETRIES', '3')),
+                backoff=float(os.getenv('DISPATCH_BACKOFF', '0.5')),
+            )
+        return _dispatcher
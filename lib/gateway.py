@@ -0,0 +1,105 @@
+# One entry point for all the backend services, each mounted under its own prefix:
+#
+#   /safety      safety_sc.py       (upload_image, get_safety_data, jobs, tiles)
+#   /safety-lite safety.py
+#   /recom       safety_recom.py    (recommend)
+#   /otp         otp.py             (send-otp, verify-otp)
+#   /emergency   time_buttons.py    (sos, contacts)
+#   /report      story_generator.py (generate-report)
+#   /symptoms    terminal.py        (predict)
+#
+#   python gateway.py                 # waitress, GATEWAY_THREADS worker threads
+#   gunicorn -k gthread -w 1 --threads 16 -b 0.0.0.0:5000 gateway:app
+#
+# Every service is imported once, so the models, caches, database writer and Twilio
+# dispatch queue are loaded once and shared by all routes. Keep a single process per
+# host: the services run background threads (write queue, dispatch workers, scoring
+# pool) that would not survive gunicorn's --preload fork.
+
+import importlib
+import os
+import sys
+import traceback
+
+from flask import Flask, jsonify
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+import metrics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    '/safety': 'safety_sc',
+    '/safety-lite': 'safety',
+    '/recom': 'safety_recom',
+    '/otp': 'otp',
+    '/emergency': 'time_buttons',
+    '/report': 'story_generator',
+    '/symptoms': 'terminal',
+}
+
+
+def load_services(prefixes=None):
+    # Returns ({prefix: flask app}, {prefix: error}); a service that fails to import is left out
+    mounts, errors = {}, {}
+    for prefix, module_name in SERVICES.items():
+        if prefixes is not None and prefix.strip('/') not in prefixes:
+            continue
+        try:
+            mounts[prefix] = importlib.import_module(module_name).app
+        except Exception as e:
+            traceback.print_exc()
+            errors[prefix] = f"{type(e).__name__}: {e}"
+    return mounts, errors
+
+
+def warm_up():
+    # Load lazily-built model state now instead of on the first request
+    if 'terminal' in sys.modules:
+        import symptom_model
+        symptom_model.get_bundle()
+
+
+def create_app(prefixes=None):
+    mounts, errors = load_services(prefixes)
+    if os.getenv('GATEWAY_WARM', '1') == '1':
+        warm_up()
+
+    root = Flask(__name__)
+    # Metrics are process-wide, so /metrics here covers every mounted service
+    root.add_url_rule('/metrics', 'metrics', metrics.metrics_response)
+
+    @root.route('/health')
+    def health():
+        status = 200 if not errors else 503
+        return jsonify({
+            "services": {prefix: SERVICES[prefix] for prefix in mounts},
+            "failed": errors,
+        }), status
+
+    return DispatcherMiddleware(root, mounts)
+
+
+# GATEWAY_SERVICES=safety,recom,... mounts only those prefixes
+_selected = os.getenv('GATEWAY_SERVICES')
+app = create_app(_selected.split(',') if _selected else None)
+
+
+def serve(host='0.0.0.0', port=5000, threads=16):
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        # Fall back to the threaded Werkzeug server without the debugger or reloader
+        from werkzeug.serving import run_simple
+        print("waitress is not installed, using the threaded Werkzeug server")
+        run_simple(host, port, app, threaded=True)
+        return
+    waitress_serve(app, host=host, port=port, threads=threads)
+
+
+if __name__ == '__main__':
+    serve(
+        host=os.getenv('GATEWAY_HOST', '0.0.0.0'),
+        port=int(os.getenv('GATEWAY_PORT', '5000')),
+        threads=int(os.getenv('GATEWAY_THREADS', '16')),
+    )
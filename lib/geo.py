@@ -0,0 +1,47 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+def parse_area(args):
+    # Returns (south, west, north, east, center) for a bbox or radius query, or None for "everything".
+    # bbox follows the GeoJSON order: min_lon,min_lat,max_lon,max_lat
+    if 'bbox' in args:
+        west, south, east, north = (float(v) for v in args['bbox'].split(','))
+        if south > north or west > east:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+        return south, west, north, east, None
+
+    if 'radius' in args:
+        if 'latitude' not in args or 'longitude' not in args:
+            raise ValueError("radius queries need latitude and longitude")
+        latitude = float(args['latitude'])
+        longitude = float(args['longitude'])
+        radius = float(args['radius'])  # Meters
+        if radius < 0:
+            raise ValueError("radius must be positive")
+
+        # Bounding box of the circle, refined with the haversine distance afterwards
+        dlat = radius / METERS_PER_DEGREE_LAT
+        dlon = radius / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 1e-6))
+        return latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon, (latitude, longitude, radius)
+
+    return None
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def haversine_m_array(latitude, longitude, latitudes, longitudes):
+    # Distances in meters from one point to arrays of points, vectorized
+    phi1 = np.radians(latitude)
+    phi2 = np.radians(latitudes)
+    dphi = phi2 - phi1
+    dlambda = np.radians(np.asarray(longitudes) - longitude)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
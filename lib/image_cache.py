@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None  # Without Pillow uploads are stored and scored as they arrive
+
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+def file_extension(filename):
+    # Keep a short, safe extension from the client filename (e.g. ".jpg")
+    ext = os.path.splitext(filename or '')[1].lower()
+    if len(ext) > 8 or not ext[1:].isalnum():
+        return ''
+    return ext
+
+
+def save_upload(file_storage, upload_dir='uploads'):
+    # Copy the upload to disk in chunks while hashing it, then store it under its content hash.
+    # Returns (digest, path); identical images end up at the same path. Werkzeug has already
+    # received (and spooled) the whole request by now, so size limits belong in MAX_CONTENT_LENGTH.
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+
+        digest = digest.hexdigest()
+        image_path = f"{upload_dir}/{digest}{file_extension(file_storage.filename)}"
+        if os.path.exists(image_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, image_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return digest, image_path
+
+
+def _save_resized(image, path, size, quality):
+    # Shrink to fit in size x size (never enlarge) and write a JPEG atomically
+    resized = image.copy()
+    resized.thumbnail((size, size))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    os.close(fd)
+    try:
+        resized.save(tmp_path, format='JPEG', quality=quality)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def prepare_images(digest, original_path, upload_dir='uploads', model_size=640, thumbnail_size=256,
+                   keep_original=False, max_pixels=25_000_000):
+    # Returns (image_path, thumbnail_path): a copy no larger than the model's input resolution,
+    # which is what gets scored and stored, and a small preview for the map. Both are JPEGs named
+    # after the content hash, so repeated uploads reuse them. Without Pillow the original is used.
+    # Images that would decode to more than max_pixels are rejected before decoding: a small
+    # compressed file can expand to gigabytes, well below Pillow's own bomb limit.
+    if Image is None:
+        return original_path, None
+
+    image_path = f"{upload_dir}/scaled/{digest}.jpg"
+    thumbnail_path = f"{upload_dir}/thumbs/{digest}.jpg"
+    if not (os.path.exists(image_path) and os.path.exists(thumbnail_path)):
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        try:
+            with Image.open(original_path) as image:
+                # Let the JPEG decoder skip detail we would throw away anyway
+                image.draft('RGB', (model_size, model_size))
+                # Only the header has been read so far; size is what draft() will decode
+                width, height = image.size
+                if max_pixels is not None and width * height > max_pixels:
+                    raise InvalidImageError(f"Image is too large ({width}x{height} pixels)")
+                image = ImageOps.exif_transpose(image).convert('RGB')
+        except (OSError, Image.DecompressionBombError, InvalidImageError) as e:
+            if os.path.exists(original_path):
+                os.remove(original_path)
+            if isinstance(e, InvalidImageError):
+                raise
+            raise InvalidImageError("Upload is not a valid image") from e
+        _save_resized(image, image_path, model_size, quality=90)
+        _save_resized(image, thumbnail_path, thumbnail_size, quality=75)
+
+    if not keep_original:
+        try:
+            os.remove(original_path)
+        except FileNotFoundError:
+            pass  # A concurrent upload of the same image already removed it
+    return image_path, thumbnail_path
+
+
+class UploadSweeper:
+    # Deletes the oldest files under upload_dir once they are older than max_age seconds or the
+    # directory holds more than max_bytes. Either limit can be None. Rows in the database keep
+    # their paths, so clients must expect an old image to be gone.
+    def __init__(self, upload_dir='uploads', max_age=None, max_bytes=None, interval=600):
+        self.upload_dir = upload_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self, now=None):
+        # Returns (files removed, bytes freed)
+        now = time.time() if now is None else now
+        files = []
+        for root, _, names in os.walk(self.upload_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                # Uploads still being written are only swept once they are clearly abandoned
+                if name.endswith('.part') and now - stat.st_mtime < 3600:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+
+        total = sum(size for _, size, _ in files)
+        removed, freed = 0, 0
+        for mtime, size, path in files:
+            too_old = self.max_age is not None and now - mtime > self.max_age
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                break  # Oldest first, so everything after this is newer and within the limits
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='upload-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                removed, freed = self.sweep()
+                if removed:
+                    print(f"Removed {removed} old uploads ({freed} bytes)")
+            except Exception as e:
+                print(f"Error sweeping uploads: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class ScoreCache:
+    # Persistent image hash -> (safety_score, report) cache with least-recently-used eviction.
+    # Several instances (safety.py and safety_sc.py in one gateway) may share the database, so the
+    # bound is enforced from the table itself rather than from a per-instance counter.
+    TOUCH_BATCH = 100  # Cache hits are recorded in memory and written in batches of this size
+
+    def __init__(self, db_path='score_cache.db', max_entries=10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS score_cache (
+                digest TEXT PRIMARY KEY,
+                safety_score REAL NOT NULL,
+                report TEXT,
+                last_used REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS score_cache_last_used ON score_cache (last_used)')
+        self._conn.commit()
+        self._touched = {}  # digest -> last hit time, not yet written
+
+    def get(self, digest):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT safety_score, report FROM score_cache WHERE digest = ?', (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            # A hit only needs to move the entry up the LRU order; no commit per read
+            self._touched[digest] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                with self._conn:
+                    self._flush_touched()
+            return row[0], row[1]
+
+    def put(self, digest, safety_score, report=None):
+        with self._lock, self._conn:
+            self._flush_touched()
+            # A score without a report (safety.py) keeps the report another service stored
+            self._conn.execute('''
+                INSERT INTO score_cache (digest, safety_score, report, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (digest) DO UPDATE SET
+                    safety_score = excluded.safety_score,
+                    report = COALESCE(excluded.report, report),
+                    last_used = excluded.last_used
+            ''', (digest, safety_score, report, time.time()))
+
+            # Evict the least recently used entries once the cache is over its bound, reading only
+            # the oldest rows off the last_used index
+            overflow = self._conn.execute('SELECT COUNT(*) FROM score_cache').fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute('''
+                    DELETE FROM score_cache WHERE digest IN (
+                        SELECT digest FROM score_cache ORDER BY last_used LIMIT ?
+                    )
+                ''', (overflow,))
+
+    def _flush_touched(self):
+        # Caller holds the lock and an open transaction
+        if self._touched:
+            self._conn.executemany(
+                'UPDATE score_cache SET last_used = MAX(last_used, ?) WHERE digest = ?',
+                [(used, digest) for digest, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM score_cache').fetchone()[0]
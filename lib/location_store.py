@@ -0,0 +1,148 @@
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+from collections import defaultdict
+
+
+class LocationStore:
+    # Thread-safe in-memory store of safety scores keyed on (latitude, longitude, time).
+    # A grid of cell_size degrees indexes the entries by position for viewport lookups,
+    # and the whole store can be snapshotted to a JSON file so it survives restarts.
+    def __init__(self, cell_size=0.01, snapshot_path=None):
+        self.cell_size = cell_size
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        # Held from serializing until the file is replaced, so a snapshot taken earlier can
+        # never land on disk after a newer one (the atexit and background snapshots can overlap)
+        self._write_lock = threading.Lock()
+        self._by_key = {}
+        self._by_id = {}
+        self._ids = []  # Always increasing, for cursor lookups
+        self._cells = defaultdict(list)  # (row, col) -> ids in that grid cell
+        self._next_id = 1
+        self._dirty = False
+
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load(snapshot_path)
+
+    def _cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def _add(self, entry):
+        key = (entry["latitude"], entry["longitude"], entry["time"])
+        self._by_key[key] = entry
+        self._by_id[entry["id"]] = entry
+        self._ids.append(entry["id"])
+        self._cells[self._cell(entry["latitude"], entry["longitude"])].append(entry["id"])
+
+    def upsert(self, latitude, longitude, time, **values):
+        # Insert or update the entry for this location and time, returns a copy of it
+        with self._lock:
+            entry = self._by_key.get((latitude, longitude, time))
+            if entry is None:
+                entry = {"id": self._next_id, "latitude": latitude, "longitude": longitude, "time": time}
+                self._next_id += 1
+                self._add(entry)
+            entry.update(values)
+            self._dirty = True
+            return dict(entry)
+
+    def get(self, latitude, longitude, time):
+        with self._lock:
+            entry = self._by_key.get((latitude, longitude, time))
+            return dict(entry) if entry is not None else None
+
+    def page(self, after_id=0, limit=None):
+        # Entries ordered by id, starting after the cursor
+        with self._lock:
+            start = bisect.bisect_right(self._ids, after_id)
+            end = len(self._ids) if limit is None else start + limit
+            return [dict(self._by_id[location_id]) for location_id in self._ids[start:end]]
+
+    def in_bbox(self, south, west, north, east):
+        # Entries inside the box, ordered by id; only the grid cells overlapping the box are visited
+        with self._lock:
+            min_row, min_col = self._cell(south, west)
+            max_row, max_col = self._cell(north, east)
+
+            if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+                # Box covers more cells than are in use, walk the used ones instead
+                candidates = [ids for (row, col), ids in self._cells.items()
+                              if min_row <= row <= max_row and min_col <= col <= max_col]
+            else:
+                candidates = [self._cells[(row, col)]
+                              for row in range(min_row, max_row + 1)
+                              for col in range(min_col, max_col + 1)
+                              if (row, col) in self._cells]
+
+            entries = []
+            for ids in candidates:
+                for location_id in ids:
+                    entry = self._by_id[location_id]
+                    if south <= entry["latitude"] <= north and west <= entry["longitude"] <= east:
+                        entries.append(dict(entry))
+            entries.sort(key=lambda entry: entry["id"])
+            return entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._by_id)
+
+    def snapshot(self, path=None):
+        # Write all entries to disk atomically; skipped when nothing changed since the last snapshot
+        path = path or self.snapshot_path
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty and os.path.exists(path):
+                    return False
+                state = {
+                    "cell_size": self.cell_size,
+                    "next_id": self._next_id,
+                    "entries": [dict(self._by_id[location_id]) for location_id in self._ids],
+                }
+                self._dirty = False
+
+            directory = os.path.dirname(os.path.abspath(path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                with self._lock:
+                    self._dirty = True
+                raise
+        return True
+
+    def load(self, path=None):
+        with open(path or self.snapshot_path) as f:
+            state = json.load(f)
+
+        with self._lock:
+            self._by_key.clear()
+            self._by_id.clear()
+            self._ids = []
+            self._cells.clear()
+            for entry in sorted(state["entries"], key=lambda entry: entry["id"]):
+                self._add(entry)
+            self._next_id = max(state.get("next_id", 1), self._ids[-1] + 1 if self._ids else 1)
+            self._dirty = False
+
+    def start_snapshots(self, interval=30.0):
+        # Snapshot in the background every interval seconds while there are changes
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"Error writing location snapshot: {e}")
+
+        threading.Thread(target=run, name='location-snapshot', daemon=True).start()
+        return stop
@@ -0,0 +1,198 @@
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+# Upper bounds in seconds; wide enough for a cache hit and a slow Gemini call alike
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    # Cumulative bucket counts per label set, rendered in the Prometheus text format
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # sorted label tuple -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(values)) for key, values in sorted(self._series.items())]
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", repr(bound)),))} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {values[-2]}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {values[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {values[-2]}')
+        return '\n'.join(lines)
+
+
+# One set of metrics per process, shared by every service mounted in it
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time spent handling a request, by service and route.')
+STAGE_SECONDS = Histogram('stage_duration_seconds', 'Time spent in one step of a request or background job.')
+HISTOGRAMS = [REQUEST_SECONDS, STAGE_SECONDS]
+
+
+def render():
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+def metrics_response():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+@contextmanager
+def timer(stage, **labels):
+    # with timer('db_upsert'): ...
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def timed(stage, fn, **labels):
+    # Wraps a callable so each call is recorded under stage
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(stage, **labels):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def timed_stream(stage, fn, **labels):
+    # Like timed() for generator functions: measured from the call until the last item
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with timer(stage, **labels):
+            yield from fn(*args, **kwargs)
+    return wrapper
+
+
+class SlowRequestProfiler:
+    # Samples the stack of every in-flight request thread every interval seconds. When a request
+    # takes longer than threshold seconds, its most frequent stacks are written to output_dir
+    # (or printed). Only the sampler thread does work while requests run.
+    def __init__(self, threshold, interval=0.005, output_dir=None, top=10):
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self.top = top
+        self._lock = threading.Lock()
+        self._active = {}  # thread ident -> Counter of stacks
+        self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+        self._thread.start()
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = collections.Counter()
+
+    def stop(self, label, elapsed):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or elapsed < self.threshold:
+            return
+        self._report(label, elapsed, samples)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[tuple(traceback.format_stack(frame))] += 1
+
+    def _report(self, label, elapsed, samples):
+        total = sum(samples.values())
+        lines = [f"Slow request {label}: {elapsed * 1000:.0f} ms, {total} samples"]
+        for stack, count in samples.most_common(self.top):
+            lines.append(f"\n--- {count} samples ({count / total:.0%}) ---")
+            lines.append(''.join(stack).rstrip())
+        text = '\n'.join(lines) + '\n'
+
+        if self.output_dir is None:
+            print(text)
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label.replace('/', '_').replace(' ', '')}.txt"
+        with open(os.path.join(self.output_dir, name), 'w') as f:
+            f.write(text)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    # PROFILE_SLOW_MS turns the profiler on; PROFILE_INTERVAL_MS and PROFILE_DIR tune it
+    global _profiler
+    threshold_ms = os.getenv('PROFILE_SLOW_MS')
+    if not threshold_ms:
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = SlowRequestProfiler(
+                threshold=float(threshold_ms) / 1000,
+                interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000,
+                output_dir=os.getenv('PROFILE_DIR'),
+            )
+    return _profiler
+
+
+def instrument(app, service=None):
+    # Times every request to app and serves the process-wide metrics at /metrics.
+    # Streaming responses are timed until the response starts, not until the last event.
+    service = service or app.import_name
+    profiler = get_profiler()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        # The rule, not the path, so /jobs/<job_id> is one series
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, service=service, method=request.method, route=route,
+                                status=response.status_code)
+        if profiler is not None:
+            profiler.stop(f"{request.method} {service}{route}", elapsed)
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
+    return app
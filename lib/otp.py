@@ -1,21 +1,32 @@
 from flask import Flask, request, jsonify
-from twilio.rest import Client
 from dotenv import load_dotenv
 import os
-import random
+import secrets
+from auth_token import issue_token
+from dispatch import PRIORITY_OTP, get_dispatcher
+import metrics
+from otp_store import MemoryOTPStore, RateLimitError, SQLiteOTPStore
 
 app = Flask(__name__)
+metrics.instrument(app)
 
-# Load environment variables
+# Load environment variables (Twilio credentials are read from .env by the dispatcher)
 load_dotenv()
 
-# Get Twilio credentials from .env
-TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
-TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+# OTP_STORE=sqlite shares codes between workers through OTP_DB; the default keeps them in this process
+OTP_SETTINGS = dict(
+    ttl=int(os.getenv('OTP_TTL', '300')),
+    capacity=int(os.getenv('OTP_CAPACITY', '10000')),
+    send_limit=(int(os.getenv('OTP_SEND_LIMIT', '3')), int(os.getenv('OTP_SEND_WINDOW', '600'))),
+    verify_limit=(int(os.getenv('OTP_VERIFY_LIMIT', '5')), int(os.getenv('OTP_VERIFY_WINDOW', '600'))),
+)
+if os.getenv('OTP_STORE', 'memory') == 'sqlite':
+    otp_storage = SQLiteOTPStore(os.getenv('OTP_DB', 'otp.db'), **OTP_SETTINGS)
+else:
+    otp_storage = MemoryOTPStore(**OTP_SETTINGS)
 
-otp_storage = {}
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# SMS go out through the shared dispatch queue instead of inside the request
+dispatcher = get_dispatcher()
 
 @app.route('/send-otp', methods=['POST'])
 def send_otp():
@@ -23,13 +34,15 @@ def send_otp():
     if not phone_number:
         return jsonify({"error": "Phone number is required"}), 400
 
-    otp = str(random.randint(100000, 999999))
+    otp = str(secrets.randbelow(900000) + 100000)
     otp_message = f"Your OTP code is {otp}"
 
     try:
-        otp_storage[phone_number] = otp
-        client.messages.create(body=otp_message, from_=TWILIO_PHONE_NUMBER, to=phone_number)
+        otp_storage.save(phone_number, otp)
+        dispatcher.send_sms(phone_number, otp_message, priority=PRIORITY_OTP)
         return jsonify({"message": "OTP sent successfully"}), 200
+    except RateLimitError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -41,9 +54,14 @@ def verify_otp():
     if not phone_number or not otp_entered:
         return jsonify({"error": "Phone number and OTP are required"}), 400
 
-    if otp_storage.get(phone_number) == otp_entered:
-        del otp_storage[phone_number]
-        return jsonify({"message": "OTP verified successfully"}), 200
+    try:
+        verified = otp_storage.verify(phone_number, otp_entered)
+    except RateLimitError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
+
+    if verified:
+        # The token proves this phone number to the other services, e.g. to edit emergency contacts
+        return jsonify({"message": "OTP verified successfully", "token": issue_token(phone_number)}), 200
     return jsonify({"error": "Invalid OTP"}), 400
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_connection
+
+
+class RateLimitError(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MemoryOTPStore:
+    # OTPs held in this process only. Every code expires after ttl seconds; when the store is
+    # full, expired codes are dropped first and then the ones closest to expiring.
+    # send_limit / verify_limit are (attempts, window seconds) per phone number. At most capacity
+    # numbers can have an open window per action; past that new numbers are refused until one closes.
+    def __init__(self, ttl=300, capacity=10000, send_limit=(3, 600), verify_limit=(5, 600), clock=time.time):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.send_limit = send_limit
+        self.verify_limit = verify_limit
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._codes = OrderedDict()  # phone -> (otp, expires_at), soonest expiry first
+        # action -> OrderedDict of phone -> [window_start, count], oldest window first
+        self._rates = {'send': OrderedDict(), 'verify': OrderedDict()}
+
+    def _check_rate(self, phone_number, action, limit, now):
+        attempts, window = limit
+        rates = self._rates[action]
+        # Every action has one window length, so the windows that are over are at the front
+        while rates and now - next(iter(rates.values()))[0] >= window:
+            rates.popitem(last=False)
+
+        rate = rates.get(phone_number)
+        if rate is None:
+            if len(rates) >= self.capacity:
+                window_start, _ = next(iter(rates.values()))
+                raise RateLimitError("Too many requests, try again later", window_start + window - now)
+            rate = rates[phone_number] = [now, 0]
+        if rate[1] >= attempts:
+            raise RateLimitError(f"Too many {action} attempts, try again later", rate[0] + window - now)
+        rate[1] += 1
+
+    def _evict(self, now):
+        # Codes are ordered by expiry, so the expired ones are at the front
+        while self._codes:
+            phone_number, (_, expires_at) = next(iter(self._codes.items()))
+            if expires_at > now and len(self._codes) < self.capacity:
+                break
+            del self._codes[phone_number]
+
+    def save(self, phone_number, otp):
+        with self._lock:
+            now = self.clock()
+            self._check_rate(phone_number, 'send', self.send_limit, now)
+            self._codes.pop(phone_number, None)
+            self._evict(now)
+            self._codes[phone_number] = (otp, now + self.ttl)
+
+    def verify(self, phone_number, otp):
+        with self._lock:
+            now = self.clock()
+            self._check_rate(phone_number, 'verify', self.verify_limit, now)
+            entry = self._codes.get(phone_number)
+            if entry is None or entry[1] <= now:
+                self._codes.pop(phone_number, None)
+                return False
+            if not hmac.compare_digest(entry[0], str(otp)):
+                return False
+            del self._codes[phone_number]
+            return True
+
+
+class SQLiteOTPStore:
+    # Same behaviour as MemoryOTPStore, kept in a SQLite file so every gunicorn worker sees the same codes
+    def __init__(self, db_path='otp.db', ttl=300, capacity=10000, send_limit=(3, 600), verify_limit=(5, 600),
+                 clock=time.time):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.capacity = capacity
+        self.send_limit = send_limit
+        self.verify_limit = verify_limit
+        self.clock = clock
+
+        conn = get_connection(db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS otp_codes (
+                phone_number TEXT PRIMARY KEY,
+                otp TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS otp_codes_expires_at ON otp_codes (expires_at)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS otp_rates (
+                phone_number TEXT NOT NULL,
+                action TEXT NOT NULL,
+                window_start REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (phone_number, action)
+            )
+        ''')
+        conn.commit()
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so workers cannot interleave read-modify-write
+        conn = get_connection(self.db_path)
+        conn.execute('BEGIN IMMEDIATE')
+        return conn
+
+    def _check_rate(self, conn, phone_number, action, limit, now):
+        attempts, window = limit
+        row = conn.execute('SELECT window_start, count FROM otp_rates WHERE phone_number = ? AND action = ?',
+                           (phone_number, action)).fetchone()
+        if row is None or now - row['window_start'] >= window:
+            conn.execute('DELETE FROM otp_rates WHERE action = ? AND window_start <= ?', (action, now - window))
+            conn.execute('INSERT OR REPLACE INTO otp_rates (phone_number, action, window_start, count) VALUES (?, ?, ?, 1)',
+                         (phone_number, action, now))
+            return
+        if row['count'] >= attempts:
+            raise RateLimitError(f"Too many {action} attempts, try again later", row['window_start'] + window - now)
+        conn.execute('UPDATE otp_rates SET count = count + 1 WHERE phone_number = ? AND action = ?',
+                     (phone_number, action))
+
+    def save(self, phone_number, otp):
+        now = self.clock()
+        conn = self._transaction()
+        try:
+            self._check_rate(conn, phone_number, 'send', self.send_limit, now)
+            conn.execute('DELETE FROM otp_codes WHERE phone_number = ?', (phone_number,))
+
+            # Expired codes go first, then the ones closest to expiring
+            conn.execute('DELETE FROM otp_codes WHERE expires_at <= ?', (now,))
+            overflow = conn.execute('SELECT COUNT(*) FROM otp_codes').fetchone()[0] - self.capacity + 1
+            if overflow > 0:
+                conn.execute('''
+                    DELETE FROM otp_codes WHERE phone_number IN (
+                        SELECT phone_number FROM otp_codes ORDER BY expires_at LIMIT ?
+                    )
+                ''', (overflow,))
+
+            conn.execute('INSERT INTO otp_codes (phone_number, otp, expires_at) VALUES (?, ?, ?)',
+                         (phone_number, otp, now + self.ttl))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def verify(self, phone_number, otp):
+        now = self.clock()
+        conn = self._transaction()
+        try:
+            self._check_rate(conn, phone_number, 'verify', self.verify_limit, now)
+            row = conn.execute('SELECT otp, expires_at FROM otp_codes WHERE phone_number = ?',
+                               (phone_number,)).fetchone()
+            verified = row is not None and row['expires_at'] > now and hmac.compare_digest(row['otp'], str(otp))
+            if verified or (row is not None and row['expires_at'] <= now):
+                conn.execute('DELETE FROM otp_codes WHERE phone_number = ?', (phone_number,))
+            conn.commit()
+            return verified
+        except Exception:
+            conn.rollback()
+            raise
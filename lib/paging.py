@@ -0,0 +1,52 @@
+import json
+from flask import Response, jsonify, stream_with_context
+
+MAX_PAGE_SIZE = 1000
+FETCH_SIZE = 500
+
+
+def is_true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def parse_page_args(args):
+    # Returns (after_id, limit, include_report, stream) from the query string.
+    # Pages are keyed on id: pass the X-Next-Cursor of one page as after_id of the next.
+    after_id = int(args.get('after_id', 0))
+
+    limit = args.get('limit')
+    if limit is not None:
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    include_report = is_true(args.get('include_report', 'true'))
+    stream = args.get('format') == 'ndjson'
+    return after_id, limit, include_report, stream
+
+
+def iter_cursor(cursor):
+    # Yield rows as dictionaries without loading the whole result set
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            yield dict(row)
+
+
+def page_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+
+def ndjson_response(items):
+    # One JSON object per line, sent as soon as each row is read
+    def generate():
+        for item in items:
+            yield json.dumps(item) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
@@ -0,0 +1,230 @@
+# Offline training for the safety tip recommender (safety_recom.py).
+#
+#   python recom_model.py train [--data user_data.csv] [--out models/recom]
+#
+# Writes the fitted KMeans model, the cluster of every row in the CSV and a fingerprint of
+# the CSV. The server loads those instead of fitting at startup, and only retrains when the
+# CSV no longer matches the fingerprint.
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+FEATURES = ["avg_distance", "travel_time", "risk_score"]
+N_CLUSTERS = 10
+DATA_PATH = os.getenv('RECOM_DATA', 'user_data.csv')
+MODEL_DIR = os.getenv('RECOM_MODEL_DIR', 'models/recom')
+
+MODEL_FILE = 'kmeans.joblib'
+CLUSTERS_FILE = 'clusters.npy'
+META_FILE = 'meta.json'
+
+
+def fingerprint(data_path):
+    digest = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace(path, write):
+    # write(tmp_path) then move it over path, so a concurrent load never sees a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def train(data_path=DATA_PATH, model_dir=MODEL_DIR):
+    data = pd.read_csv(data_path)
+
+    # Train K-Means model with 10 clusters
+    kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42, n_init=10)
+    clusters = kmeans.fit_predict(data[FEATURES].to_numpy()).astype(np.int32)
+
+    os.makedirs(model_dir, exist_ok=True)
+    _replace(os.path.join(model_dir, MODEL_FILE), lambda path: joblib.dump(kmeans, path))
+    # np.save appends .npy to names without it, so hand it an open file
+    _replace(os.path.join(model_dir, CLUSTERS_FILE), lambda path: _save_array(path, clusters))
+
+    # Written last, so an interrupted run is retrained on the next start
+    meta = {
+        "fingerprint": fingerprint(data_path),
+        "rows": len(data),
+        "features": FEATURES,
+        "n_clusters": N_CLUSTERS,
+        "trained_at": time.time(),
+    }
+    _replace(os.path.join(model_dir, META_FILE), lambda path: _save_json(path, meta))
+    return meta
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+
+
+def _save_json(path, value):
+    with open(path, 'w') as f:
+        json.dump(value, f, indent=2)
+
+
+def is_current(data_path=DATA_PATH, model_dir=MODEL_DIR):
+    meta_path = os.path.join(model_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta.get("fingerprint") == fingerprint(data_path) and meta.get("features") == FEATURES
+
+
+def load(data_path=DATA_PATH, model_dir=MODEL_DIR):
+    # Returns (kmeans, data with a "cluster" column), retraining first if the CSV changed
+    if not is_current(data_path, model_dir):
+        print(f"Training recommender model from {data_path}")
+        train(data_path, model_dir)
+
+    kmeans = joblib.load(os.path.join(model_dir, MODEL_FILE))
+    clusters = np.load(os.path.join(model_dir, CLUSTERS_FILE))
+
+    data = pd.read_csv(data_path)
+    data["cluster"] = clusters
+    return kmeans, data
+
+
+def nearest_clusters(centers, features):
+    # Same result as kmeans.predict, without scikit-learn's per-call validation overhead
+    features = np.asarray(features, dtype=np.float64).reshape(-1, centers.shape[1])
+    distances = ((features[:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+
+class ClusterIndex:
+    # Row indices and plain-dict records of every cluster, built once at load time
+    # so a request only has to sample a few rows instead of filtering the DataFrame.
+    def __init__(self, data):
+        self._rows = data.drop(columns=["cluster"]).to_dict(orient="records")
+        self._local = threading.local()
+        self.refresh(data["cluster"].to_numpy())
+
+    def refresh(self, clusters):
+        # Rebuild membership from a new cluster label per row, e.g. after the centroids moved.
+        # Records and members are swapped together so readers never mix the two.
+        records = [dict(row, cluster=int(cluster)) for row, cluster in zip(self._rows, clusters)]
+        members = {int(cluster): np.flatnonzero(clusters == cluster) for cluster in np.unique(clusters)}
+        self._state = (records, members)
+
+    def _rng(self):
+        # NumPy generators are not thread-safe, so every thread gets its own
+        rng = getattr(self._local, 'rng', None)
+        if rng is None:
+            rng = self._local.rng = np.random.default_rng()
+        return rng
+
+    def sample(self, cluster, n):
+        records, members = self._state
+        members = members.get(int(cluster))
+        if members is None or len(members) == 0:
+            return []
+        picks = self._rng().choice(len(members), size=min(n, len(members)), replace=False)
+        return [records[members[i]] for i in picks]
+
+
+class OnlineClusterer:
+    # Keeps the cluster centroids current by folding new user feature vectors into a
+    # MiniBatchKMeans model on a background thread. New vectors wait in a bounded buffer
+    # (the oldest are dropped when it is full). Readers use `centers`, a read-only array
+    # that is replaced as a whole after every update, so they never wait for the model.
+    # on_update(centers) is called after each swap, e.g. to refresh a ClusterIndex.
+    def __init__(self, kmeans, seed_features, batch_size=256, max_pending=10000, interval=5.0, on_update=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_update = on_update
+        self._model = MiniBatchKMeans(
+            n_clusters=kmeans.n_clusters,
+            init=kmeans.cluster_centers_,  # Same centroid order, so cluster ids keep their tips
+            n_init=1,
+            batch_size=batch_size,
+            random_state=42,
+            # Never re-seed rarely hit centroids onto random new points; that would hand a
+            # cluster id, and its tips, to a different group of users
+            reassignment_ratio=0.0,
+        )
+        # Start from the training data so new vectors nudge the centroids instead of replacing them
+        self._model.partial_fit(np.asarray(seed_features, dtype=np.float64))
+        self.centers = self._frozen_centers()
+        self.updates = 0
+
+        self._pending = deque(maxlen=max_pending)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='online-kmeans', daemon=True)
+        self._thread.start()
+
+    def _frozen_centers(self):
+        centers = self._model.cluster_centers_.copy()
+        centers.flags.writeable = False
+        return centers
+
+    def observe(self, features):
+        features = np.asarray(features, dtype=np.float64).reshape(-1, self.centers.shape[1])
+        with self._lock:
+            self._pending.extend(features)
+
+    def update(self):
+        # Fold the buffered vectors into the model; returns False if there were too few of them
+        with self._lock:
+            if len(self._pending) < self._model.n_clusters:
+                return False
+            batch = np.array(self._pending)
+            self._pending.clear()
+        # One NaN or infinite row would make partial_fit raise and throw away everyone's vectors
+        batch = batch[np.isfinite(batch).all(axis=1)]
+
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            if len(chunk) >= self._model.n_clusters:
+                self._model.partial_fit(chunk)
+        self.centers = self._frozen_centers()  # Single reference swap
+        self.updates += 1
+        if self.on_update is not None:
+            self.on_update(self.centers)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:
+                print(f"Error updating clusters: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['train'])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--out', default=MODEL_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    meta = train(args.data, args.out)
+    print(f"Trained on {meta['rows']} rows in {time.perf_counter() - start:.2f}s, saved to {args.out}")
@@ -0,0 +1,221 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class ModelBusyError(Exception):
+    pass
+
+
+class ModelTimeoutError(Exception):
+    pass
+
+
+class TTLCache:
+    # Least-recently-used cache whose entries also expire after ttl seconds
+    def __init__(self, max_entries=1024, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def normalize(text):
+    # Case and whitespace differences should not miss the cache
+    return ' '.join(str(text).split()).lower()
+
+
+class GeminiBackend:
+    # Backends take a timeout in seconds and raise TimeoutError once it passes, so a hung
+    # request cannot hold a ReportClient slot for longer than that
+    def __init__(self, model="gemini-1.5-flash", temperature=0.7, max_tokens=500):
+        import google.generativeai as genai
+        from google.api_core.exceptions import DeadlineExceeded
+        self.genai = genai
+        self.deadline_exceeded = DeadlineExceeded
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def _request_options(self, timeout):
+        return {"timeout": timeout} if timeout is not None else None
+
+    def generate(self, prompt, timeout=None):
+        try:
+            response = self.genai.generate_text(
+                model=self.model, prompt=prompt, temperature=self.temperature, max_tokens=self.max_tokens,
+                request_options=self._request_options(timeout),
+            )
+        except self.deadline_exceeded as e:
+            raise TimeoutError(f"Gemini did not answer within {timeout}s") from e
+        return response.result.strip()
+
+    def stream(self, prompt, timeout=None):
+        # Yields the report text as the model produces it; the timeout covers the whole stream
+        model = self.genai.GenerativeModel(self.model)
+        try:
+            response = model.generate_content(
+                prompt,
+                generation_config={"temperature": self.temperature, "max_output_tokens": self.max_tokens},
+                stream=True,
+                request_options=self._request_options(timeout),
+            )
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except self.deadline_exceeded as e:
+            raise TimeoutError(f"Gemini did not finish within {timeout}s") from e
+
+
+class FakeBackend:
+    # Local stand-in for load tests: answers after `latency` seconds without calling any API.
+    # With hang=True it never answers, like a stuck upstream, until the timeout gives up on it.
+    def __init__(self, latency=0.5, hang=False):
+        self.latency = latency
+        self.hang = hang
+        self.calls = 0
+
+    def _wait(self, seconds, timeout):
+        if timeout is not None and seconds > timeout:
+            time.sleep(max(timeout, 0))
+            raise TimeoutError(f"Fake backend did not answer within {timeout}s")
+        if seconds == float('inf'):
+            threading.Event().wait()
+        time.sleep(seconds)
+
+    def generate(self, prompt, timeout=None):
+        self.calls += 1
+        self._wait(float('inf') if self.hang else self.latency, timeout)
+        return f"Report: {prompt[:200]}"
+
+    def stream(self, prompt, timeout=None):
+        # Same text as generate(), one word at a time spread over the latency
+        self.calls += 1
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        words = f"Report: {prompt[:200]}".split(' ')
+        for i, word in enumerate(words):
+            if self.hang and i == 1:
+                # Stall after the first word
+                self._wait(float('inf'), deadline - time.monotonic() if deadline is not None else None)
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            self._wait(self.latency / len(words), remaining)
+            yield word if i == 0 else ' ' + word
+
+
+class ReportClient:
+    # Calls the model backend with at most max_concurrency requests in flight and a timeout
+    # per call, and caches the generated reports by key.
+    def __init__(self, backend, max_concurrency=4, timeout=30.0, queue_timeout=5.0, cache=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.cache = cache if cache is not None else TTLCache()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='report-model')
+
+    def generate(self, key, prompt):
+        # Returns (report, cached)
+        report = self.cache.get(key)
+        if report is not None:
+            return report, True
+
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise ModelBusyError("Too many reports being generated, try again later")
+
+        try:
+            future = self._pool.submit(self.backend.generate, prompt, timeout=self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is only freed once the backend call really ends, even after we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            report = future.result(timeout=self.timeout)
+        except (FutureTimeoutError, TimeoutError):
+            raise ModelTimeoutError(f"Report generation took longer than {self.timeout}s")
+
+        self.cache.set(key, report)
+        return report, False
+
+    def stream(self, key, prompt):
+        # Returns (chunks, cached). Nothing happens until the chunks are first iterated: that takes
+        # a slot (raising ModelBusyError) and starts the backend stream on the pool. Waiting for
+        # each chunk is bounded by the timeout, so a stalled upstream cannot hold the request
+        # thread; like generate(), the slot itself is freed once the backend stream really ends.
+        report = self.cache.get(key)
+        if report is not None:
+            return iter([report]), True
+
+        def pump(received, cancelled):
+            try:
+                for chunk in self.backend.stream(prompt, timeout=self.timeout):
+                    if cancelled.is_set():
+                        break
+                    received.put(('chunk', chunk))
+                received.put(('done', None))
+            except Exception as e:
+                received.put(('error', e))
+            finally:
+                self._slots.release()
+
+        def chunks():
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                raise ModelBusyError("Too many reports being generated, try again later")
+
+            received = queue.Queue()
+            cancelled = threading.Event()
+            try:
+                self._pool.submit(pump, received, cancelled)
+            except Exception:
+                self._slots.release()
+                raise
+
+            deadline = time.monotonic() + self.timeout
+            parts = []
+            try:
+                while True:
+                    try:
+                        kind, value = received.get(timeout=max(deadline - time.monotonic(), 0))
+                    except queue.Empty:
+                        raise ModelTimeoutError(f"Report generation took longer than {self.timeout}s")
+                    if kind == 'done':
+                        break
+                    if kind == 'error':
+                        if isinstance(value, TimeoutError):
+                            raise ModelTimeoutError(f"Report generation took longer than {self.timeout}s")
+                        raise value
+                    parts.append(value)
+                    yield value
+            finally:
+                # Stops the backend stream at its next chunk if we gave up on it
+                cancelled.set()
+            # Only complete reports are cached
+            self.cache.set(key, ''.join(parts).strip())
+
+        return chunks(), False
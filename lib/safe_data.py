@@ -1,7 +1,7 @@
-import sqlite3
+from db import get_connection, stored_time_columns
 
-def init_db():
-    conn = sqlite3.connect('safety_data.db')  # Creates the database file
+def init_db(db_path=None):
+    conn = get_connection(db_path)  # Creates the database file (in WAL mode)
     cursor = conn.cursor()
 
     # Create table to store location data
@@ -17,8 +17,80 @@ def init_db():
         )
     ''')
 
+    # One row per (latitude, longitude, time) so uploads can upsert in a single statement
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'location_data_key'")
+    if cursor.fetchone() is None:
+        # Older databases could hold duplicates; keep the most recent one
+        cursor.execute('''
+            DELETE FROM location_data WHERE id NOT IN (
+                SELECT MAX(id) FROM location_data GROUP BY latitude, longitude, time
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX location_data_key ON location_data (latitude, longitude, time)
+        ''')
+
+    # Parsed copies of the free-form time text, filled in by every upsert, for time-of-day and recency queries
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(location_data)')}
+    if 'time_epoch' not in columns:
+        cursor.execute('ALTER TABLE location_data ADD COLUMN time_epoch REAL')
+    if 'hour_of_day' not in columns:
+        cursor.execute('ALTER TABLE location_data ADD COLUMN hour_of_day INTEGER')
+    # Small preview of the image for the map; older rows have none
+    if 'thumbnail_path' not in columns:
+        cursor.execute('ALTER TABLE location_data ADD COLUMN thumbnail_path TEXT')
+
+    # Backfill rows written before the columns existed (or by writers that leave them empty).
+    # Unparseable times are marked with UNPARSED_HOUR so they are not parsed again on every start.
+    rows = cursor.execute('SELECT id, time FROM location_data WHERE time_epoch IS NULL AND hour_of_day IS NULL').fetchall()
+    cursor.executemany('UPDATE location_data SET time_epoch = ?, hour_of_day = ? WHERE id = ?',
+                       [stored_time_columns(time) + (row_id,) for row_id, time in rows])
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS location_data_epoch ON location_data (time_epoch)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS location_data_hour ON location_data (hour_of_day, time_epoch)')
+
+    # R*Tree spatial index over the points (each point is a zero-size box)
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS location_rtree USING rtree(
+            id,
+            min_lat, max_lat,
+            min_lon, max_lon
+        )
+    ''')
+
+    # Keep the spatial index in sync with location_data
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS location_rtree_insert
+        AFTER INSERT ON location_data
+        BEGIN
+            INSERT OR REPLACE INTO location_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS location_rtree_update
+        AFTER UPDATE OF latitude, longitude ON location_data
+        BEGIN
+            INSERT OR REPLACE INTO location_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS location_rtree_delete
+        AFTER DELETE ON location_data
+        BEGIN
+            DELETE FROM location_rtree WHERE id = old.id;
+        END
+    ''')
+
+    # Backfill rows that were stored before the index existed
+    cursor.execute('''
+        INSERT INTO location_rtree (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT id, latitude, latitude, longitude, longitude FROM location_data
+        WHERE id NOT IN (SELECT id FROM location_rtree)
+    ''')
+
     conn.commit()
-    conn.close()
 
 if __name__ == '__main__':
     init_db()
@@ -1,13 +1,33 @@
 import sys
 sys.path.append(r'C:\Users\mukes\OneDrive\Documents\GenAI x Gender Tech Hackathon')
 
+import atexit
+import os
 from flask import Flask, request, jsonify
 from a import calculate_safety_score  # Now it can import the function from a.py
+from image_cache import ScoreCache, save_upload
+from geo import haversine_m, parse_area
+from location_store import LocationStore
+from paging import ndjson_response, page_response, parse_page_args
+import metrics
 
 app = Flask(__name__)
+metrics.instrument(app)
 
-# In-memory store for location, time, and safety score (replace with a database if needed)
-location_data = []
+# Scores of images we have already seen, keyed by their content hash
+score_cache = ScoreCache(
+    os.getenv('SCORE_CACHE_DB', 'score_cache.db'),
+    max_entries=int(os.getenv('SCORE_CACHE_SIZE', '10000')),
+)
+
+# In-memory store for location, time, and safety score, optionally snapshotted to disk
+location_data = LocationStore(
+    cell_size=float(os.getenv('LOCATION_CELL_SIZE', '0.01')),
+    snapshot_path=os.getenv('LOCATION_SNAPSHOT'),
+)
+if location_data.snapshot_path:
+    location_data.start_snapshots(float(os.getenv('LOCATION_SNAPSHOT_INTERVAL', '30')))
+    atexit.register(location_data.snapshot)
 
 @app.route('/upload_image', methods=['POST'])
 def upload_image():
@@ -23,30 +43,24 @@ def upload_image():
         longitude = float(request.form['longitude'])
         time = request.form['time']
 
-        image_path = f"uploads/{image.filename}"
+        # Store the image under its content hash so repeated uploads share one file
+        with metrics.timer('image_save'):
+            digest, image_path = save_upload(image)
         print(image_path)
-        image.save(image_path)
-
-        # Call the external function to calculate the safety score
-        safety_score = calculate_safety_score(image_path)
 
-        # Check if the location and time combination already exists, if so, update it
-        existing_location = next(
-            (item for item in location_data if item["latitude"] == latitude and item["longitude"] == longitude and item["time"] == time),
-            None
-        )
-
-        if existing_location:
-            # Update the safety score for the existing location and time
-            existing_location["safety_score"] = safety_score
+        # Only call the model for images we have not scored before
+        cached = score_cache.get(digest)
+        if cached is not None:
+            safety_score = cached[0]
         else:
-            # Add new location data
-            location_data.append({
-                "latitude": latitude,
-                "longitude": longitude,
-                "time": time,
-                "safety_score": safety_score
-            })
+            # Call the external function to calculate the safety score
+            with metrics.timer('score'):
+                safety_score = calculate_safety_score(image_path)
+            score_cache.put(digest, safety_score)
+
+        # Add the location data, or update the safety score if the location and time combination already exists
+        with metrics.timer('db_upsert', store='memory'):
+            location_data.upsert(latitude, longitude, time, safety_score=safety_score)
 
         return jsonify({
             "latitude": latitude,
@@ -60,8 +74,31 @@ def upload_image():
 
 @app.route('/get_safety_data', methods=['GET'])
 def get_safety_data():
-    # Return all stored location data
-    return jsonify(location_data), 200
+    try:
+        after_id, limit, include_report, stream = parse_page_args(request.args)
+        area = parse_area(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if area is None:
+        # Start right after the cursor instead of scanning from the beginning
+        page = location_data.page(after_id, limit)
+    else:
+        # Only look at the grid cells inside the requested area
+        south, west, north, east, center = area
+        page = [item for item in location_data.in_bbox(south, west, north, east) if item["id"] > after_id]
+        if center is not None:
+            latitude, longitude, radius = center
+            page = [item for item in page
+                    if haversine_m(latitude, longitude, item["latitude"], item["longitude"]) <= radius]
+        if limit is not None:
+            page = page[:limit]
+
+    if stream:
+        return ndjson_response(page), 200
+
+    next_cursor = page[-1]["id"] if limit is not None and len(page) == limit else None
+    return page_response(page, next_cursor), 200
 
 if __name__ == '__main__':
     app.run(host='192.168.131.199', port=5000, debug=True)
@@ -3,21 +3,39 @@
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-from sklearn.cluster import KMeans
-import pandas as pd
+import os
 import numpy as np
+import recom_model
+import metrics
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app)
 
-# Load dataset from the CSV file
-data_file_path = "user_data.csv"  # Path to your CSV file
-data = pd.read_csv(data_file_path)
+# Load the K-Means model trained by `python recom_model.py train`; it is only refitted when user_data.csv changed
+data_file_path = recom_model.DATA_PATH  # Path to your CSV file
+kmeans, data = recom_model.load(data_file_path)
 
-# Train K-Means model with 10 clusters
-features = data[["avg_distance", "travel_time", "risk_score"]]
-kmeans = KMeans(n_clusters=10, random_state=42)  # Using 10 clusters
-data["cluster"] = kmeans.fit_predict(features)
+# Members of every cluster, so /recommend does not filter the whole DataFrame per request
+cluster_index = recom_model.ClusterIndex(data)
+
+# With RECOM_ONLINE=1 the centroids keep learning from the users sent to /recommend
+online_clusters = None
+if os.getenv("RECOM_ONLINE", "0") == "1":
+    seed_features = data[recom_model.FEATURES].to_numpy()
+    online_clusters = recom_model.OnlineClusterer(
+        kmeans,
+        seed_features,
+        max_pending=int(os.getenv("RECOM_ONLINE_BUFFER", "10000")),
+        interval=float(os.getenv("RECOM_ONLINE_INTERVAL", "5")),
+        # Re-assign the known users to the moved centroids so similar_users matches the cluster
+        on_update=lambda centers: cluster_index.refresh(recom_model.nearest_clusters(centers, seed_features)),
+    )
+
+def cluster_centers():
+    if online_clusters is not None:
+        return online_clusters.centers
+    return kmeans.cluster_centers_
 
 # Define safety tips for each cluster
 safety_tips_by_cluster = {
@@ -82,18 +100,78 @@ def recommend():
     risk_score = user_data["risk_score"]
 
     # Predict the cluster for the user
-    user_features = np.array([[avg_distance, travel_time, risk_score]])
-    cluster = kmeans.predict(user_features)[0]
+    user_features = np.array([[avg_distance, travel_time, risk_score]], dtype=np.float64)
+    with metrics.timer('kmeans_predict'):
+        cluster = int(recom_model.nearest_clusters(cluster_centers(), user_features)[0])
+    # JSON allows Infinity and NaN; only finite vectors may move the shared centroids
+    if online_clusters is not None and np.isfinite(user_features).all():
+        online_clusters.observe(user_features)
 
     # Get recommendations for the cluster
-    recommendations = data[data["cluster"] == cluster]
     safety_tips = safety_tips_by_cluster.get(cluster, ["No specific tips available."])
 
     response = {
-        "cluster": int(cluster),
+        "cluster": cluster,
         "safety_tips": safety_tips,
-        "similar_users": recommendations.sample(n=min(5, len(recommendations))).to_dict(orient="records")  # Limit to 5 similar users
+        "similar_users": cluster_index.sample(cluster, 5)  # Limit to 5 similar users
+    }
+    return jsonify(response)
+
+MAX_BATCH_SIZE = int(os.getenv("RECOM_MAX_BATCH", "100000"))
+
+def batch_features(payload):
+    # Accepts a list of users, {"users": [...]} or columnar {"avg_distance": [...], "travel_time": [...], "risk_score": [...]}
+    if isinstance(payload, dict) and "users" in payload:
+        payload = payload["users"]
+
+    if isinstance(payload, list):
+        if not all(isinstance(user, dict) for user in payload):
+            raise ValueError("Every user must be an object with " + ", ".join(recom_model.FEATURES))
+        user_ids = [user.get("user_id") for user in payload]
+        rows = [[user[name] for name in recom_model.FEATURES] for user in payload]
+        features = np.array(rows, dtype=np.float64).reshape(-1, len(recom_model.FEATURES))
+    elif isinstance(payload, dict):
+        columns = [payload[name] for name in recom_model.FEATURES]
+        if len(set(len(column) for column in columns)) != 1:
+            raise ValueError("All feature columns must have the same length")
+        features = np.column_stack([np.asarray(column, dtype=np.float64) for column in columns])
+        user_ids = payload.get("user_id")
+        if user_ids is not None and len(user_ids) != len(features):
+            raise ValueError("user_id must have one entry per user")
+    else:
+        raise ValueError("Expected a list of users or feature columns")
+
+    if user_ids is not None and all(user_id is None for user_id in user_ids):
+        user_ids = None
+    return features, user_ids
+
+@app.route("/recommend/batch", methods=["POST"])
+def recommend_batch():
+    try:
+        features, user_ids = batch_features(request.get_json())
+    except KeyError as e:
+        return jsonify({"error": f"Missing feature {e}"}), 400
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    if len(features) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_BATCH_SIZE} users per batch"}), 413
+
+    # Predict the clusters of all users in one vectorized call
+    with metrics.timer('kmeans_predict'):
+        clusters = recom_model.nearest_clusters(cluster_centers(), features)
+
+    # Tips are listed once per cluster instead of once per user
+    response = {
+        "count": len(clusters),
+        "cluster": clusters.tolist(),
+        "safety_tips": {
+            str(cluster): safety_tips_by_cluster.get(cluster, ["No specific tips available."])
+            for cluster in np.unique(clusters).tolist()
+        }
     }
+    if user_ids is not None:
+        response["user_id"] = user_ids
     return jsonify(response)
 
 if __name__ == "__main__":
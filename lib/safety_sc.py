@@ -3,15 +3,116 @@ import sys
 sys.path.append(r'C:\Users\mukes\OneDrive\Documents\GenAI x Gender Tech Hackathon')
 
 
-import sqlite3
-from flask import Flask, request, jsonify
+import os
+import time as time_module
+from flask import Flask, request, jsonify, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from a import calculate_safety_score, send_to_gemini_model  # Import both functions from a.py
+try:
+    from a import stream_gemini_model  # Optional: yields the report text as Gemini produces it
+except ImportError:
+    stream_gemini_model = None
+from safe_data import init_db
+from db import WriteQueue, get_connection
+from scoring_jobs import ScoringPipeline, QueueFullError
+from image_cache import InvalidImageError, ScoreCache, UploadSweeper, prepare_images, save_upload
+from geo import haversine_m, parse_area
+from tiles import TileAggregator
+from paging import is_true, iter_cursor, ndjson_response, page_response, parse_page_args
+from sse import sse_response
+from score_window import decayed_summary, parse_window_args, query_observations
+import metrics
 app = Flask(__name__)
-# Function to connect to the database
-def get_db_connection():
-    conn = sqlite3.connect('safety_data.db')  # Connect to SQLite database
-    conn.row_factory = sqlite3.Row  # This allows us to access rows as dictionaries
-    return conn
+metrics.instrument(app)
+
+# Werkzeug refuses request bodies past MAX_UPLOAD_MB (by Content-Length, or while reading a chunked body)
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', '10'))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024  # Room for the form fields
+
+# Images are scored and kept at the model's input resolution, plus a thumbnail for map previews
+MODEL_INPUT_SIZE = int(os.getenv('MODEL_INPUT_SIZE', '640'))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '256'))
+# Uploads that would decode to more pixels than this are rejected before decoding
+MAX_IMAGE_PIXELS = int(float(os.getenv('MAX_IMAGE_MEGAPIXELS', '25')) * 1_000_000)
+KEEP_ORIGINALS = is_true(os.getenv('KEEP_ORIGINALS', '0'))
+
+# Drop stored images once they are older than UPLOAD_RETENTION_DAYS or uploads/ grows past UPLOAD_DISK_LIMIT_MB
+upload_retention_days = os.getenv('UPLOAD_RETENTION_DAYS')
+upload_disk_limit_mb = os.getenv('UPLOAD_DISK_LIMIT_MB')
+if upload_retention_days or upload_disk_limit_mb:
+    upload_sweeper = UploadSweeper(
+        'uploads',
+        max_age=float(upload_retention_days) * 86400 if upload_retention_days else None,
+        max_bytes=int(float(upload_disk_limit_mb) * 1024 * 1024) if upload_disk_limit_mb else None,
+        interval=float(os.getenv('UPLOAD_SWEEP_INTERVAL', '600')),
+    )
+    upload_sweeper.start()
+
+# Make sure the table and its spatial index exist before serving requests
+init_db()
+
+# Batches upserts from all request threads into a single writer
+write_queue = WriteQueue()
+
+# Danger-zone statistics per map tile, rebuilt from the database and then kept up to date on every upload
+TILE_ZOOMS = [int(z) for z in os.getenv('TILE_ZOOMS', '10,11,12,13,14,15,16').split(',')]
+tiles = TileAggregator(TILE_ZOOMS)
+tiles.rebuild(get_connection().execute('SELECT latitude, longitude, time, safety_score FROM location_data'))
+
+def save_location(latitude, longitude, time, safety_score, report, image_path, thumbnail_path=None):
+    # Insert the location data, or update it if the location and time combination already exists
+    future = write_queue.upsert_location(latitude, longitude, time, safety_score, report, image_path, thumbnail_path)
+
+    def update_tiles(done):
+        if done.exception() is None:
+            tiles.observe(latitude, longitude, time, safety_score)
+
+    future.add_done_callback(update_tiles)
+    return future
+
+# Score and report of images we have already seen, keyed by their content hash
+score_cache = ScoreCache(
+    os.getenv('SCORE_CACHE_DB', 'score_cache.db'),
+    max_entries=int(os.getenv('SCORE_CACHE_SIZE', '10000')),
+)
+
+def get_cached_result(digest):
+    cached = score_cache.get(digest)
+    # Entries written by safety.py have a score but no report
+    if cached is None or cached[1] is None:
+        return None
+    return cached
+
+def save_job_result(job):
+    score_cache.put(job['digest'], job['safety_score'], job['report'])
+    save_location(job['latitude'], job['longitude'], job['time'],
+                  job['safety_score'], job['report'], job['image_path'], job['thumbnail_path']).result()
+
+# Background scoring for async uploads; swap scorer/reporter for stubs when testing
+pipeline = ScoringPipeline(
+    metrics.timed('score', calculate_safety_score),
+    metrics.timed('report', send_to_gemini_model),
+    on_result=save_job_result,
+    stream_reporter=metrics.timed_stream('report', stream_gemini_model) if stream_gemini_model else None,
+    max_workers=int(os.getenv('SCORING_WORKERS', '4')),
+    max_pending=int(os.getenv('SCORING_QUEUE_SIZE', '32')),
+)
+
+def wants_async():
+    return is_true(request.args.get('async', request.form.get('async', '')))
+
+def wants_stream():
+    return is_true(request.args.get('stream', request.form.get('stream', '')))
+
+def job_events(job_id):
+    # Partial report text as "report" events, then a final "done" (or "failed") event with the result
+    for event, data in pipeline.events(job_id, timeout=float(os.getenv('SCORING_STREAM_TIMEOUT', '120'))):
+        if event == 'report':
+            yield 'report', {"text": data}
+        else:
+            data.pop('partial_report', None)
+            yield event, data
 
 @app.route('/upload_image', methods=['POST'])
 def upload_image():
@@ -27,76 +128,184 @@ def upload_image():
         longitude = float(request.form['longitude'])
         time = request.form['time']
 
-        # Save the image to the uploads folder
-        image_path = f"uploads/{image.filename}"
-        image.save(image_path)
-
-        # Call the external function to calculate the safety score
-        safety_score = calculate_safety_score(image_path)
-
-        # Call the send_to_gemini_model function to get the detailed report
-        report = send_to_gemini_model(image_path)
-
-        # Connect to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Check if the location and time combination already exists, if so, update it
-        cursor.execute('''
-            SELECT * FROM location_data
-            WHERE latitude = ? AND longitude = ? AND time = ?
-        ''', (latitude, longitude, time))
-        existing_location = cursor.fetchone()
-
-        if existing_location:
-            # Update the existing location data
-            cursor.execute('''
-                UPDATE location_data
-                SET safety_score = ?, report = ?, image_path = ?
-                WHERE latitude = ? AND longitude = ? AND time = ?
-            ''', (safety_score, report, image_path, latitude, longitude, time))
+        # Save the image to the uploads folder under its content hash, then shrink it for the model
+        with metrics.timer('image_save'):
+            digest, original_path = save_upload(image)
+            image_path, thumbnail_path = prepare_images(digest, original_path, model_size=MODEL_INPUT_SIZE,
+                                                        thumbnail_size=THUMBNAIL_SIZE, keep_original=KEEP_ORIGINALS,
+                                                        max_pixels=MAX_IMAGE_PIXELS)
+
+        cached = get_cached_result(digest)
+
+        if cached is None and (wants_async() or wants_stream()):
+            # Score in the background and let the client poll /jobs/<id>
+            try:
+                job_id = pipeline.submit(image_path, digest=digest, latitude=latitude, longitude=longitude, time=time,
+                                         thumbnail_path=thumbnail_path)
+            except QueueFullError as e:
+                return jsonify({"error": str(e)}), 503
+
+            if wants_stream():
+                # Send the report text as server-sent events while Gemini writes it
+                return sse_response(job_events(job_id))
+
+            return jsonify({
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": url_for('get_job', job_id=job_id)
+            }), 202
+
+        if cached is not None:
+            # Same image as an earlier upload, reuse its score and report
+            safety_score, report = cached
         else:
-            # Insert new location data into the database
-            cursor.execute('''
-                INSERT INTO location_data (latitude, longitude, time, safety_score, report, image_path)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (latitude, longitude, time, safety_score, report, image_path))
+            # Calculate the safety score and get the detailed Gemini report at the same time
+            safety_score, report = pipeline.score_image(image_path)
+            score_cache.put(digest, safety_score, report)
 
-        # Commit changes and close the connection
-        conn.commit()
-        conn.close()
+        # Wait for the write so the row is visible as soon as we respond
+        save_location(latitude, longitude, time, safety_score, report, image_path, thumbnail_path).result()
 
-        return jsonify({
+        result = {
             "latitude": latitude,
             "longitude": longitude,
             "time": time,
             "safety_score": safety_score,
             "report": report,
-            "image_path": image_path  # Include the image path in the response
-        }), 200
+            "image_path": image_path,  # Include the image path in the response
+            "thumbnail_path": thumbnail_path
+        }
+        if wants_stream():
+            return sse_response([('report', {"text": report}), ('done', dict(result, status='done'))])
+        return jsonify(result), 200
 
+    except RequestEntityTooLarge:
+        return jsonify({"error": f"Images must be smaller than {MAX_UPLOAD_MB:g} MB"}), 413
+    except InvalidImageError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = pipeline.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    if pipeline.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    return sse_response(job_events(job_id))
+
+LOCATION_COLUMNS = ('id', 'latitude', 'longitude', 'time', 'safety_score', 'report', 'image_path', 'thumbnail_path')
+
+def query_locations(cursor, area=None, after_id=0, limit=None, include_report=True):
+    # Rows ordered by id, starting after the cursor; leaving out the report keeps responses small
+    columns = ', '.join(f'd.{name}' for name in LOCATION_COLUMNS if include_report or name != 'report')
+    params = [after_id]
+
+    if area is None:
+        sql = f'SELECT {columns} FROM location_data d WHERE d.id > ?'
+    else:
+        # The R*Tree stores 32-bit floats rounded outwards, so re-check the exact columns
+        south, west, north, east = area
+        sql = f'''
+            SELECT {columns} FROM location_rtree r
+            JOIN location_data d ON d.id = r.id
+            WHERE d.id > ?
+              AND r.max_lat >= ? AND r.min_lat <= ?
+              AND r.max_lon >= ? AND r.min_lon <= ?
+              AND d.latitude BETWEEN ? AND ?
+              AND d.longitude BETWEEN ? AND ?
+        '''
+        params += [south, north, west, east, south, north, west, east]
+
+    sql += ' ORDER BY d.id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+
+    cursor.execute(sql, params)
+    return cursor
+
 @app.route('/get_safety_data', methods=['GET'])
 def get_safety_data():
     try:
-        # Connect to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        area = parse_area(request.args)
+        after_id, limit, include_report, stream = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Reuse this thread's database connection
+        cursor = get_connection().cursor()
+
+        # Only fetch the rows inside the requested area, if any
+        center = None
+        if area is not None:
+            south, west, north, east, center = area
+            area = (south, west, north, east)
+        rows = iter_cursor(query_locations(cursor, area, after_id, limit, include_report))
+
+        # Keep track of the last id read so the next page starts after it,
+        # even when the radius filter drops rows from this one
+        scanned = {'count': 0, 'last_id': None}
 
-        # Fetch all location data
-        cursor.execute('SELECT * FROM location_data')
-        rows = cursor.fetchall()
+        def location_data():
+            for row in rows:
+                scanned['count'] += 1
+                scanned['last_id'] = row['id']
+                if center is not None:
+                    latitude, longitude, radius = center
+                    if haversine_m(latitude, longitude, row['latitude'], row['longitude']) > radius:
+                        continue
+                yield row
 
-        # Convert the rows to a list of dictionaries
-        location_data = [dict(row) for row in rows]
+        if stream:
+            return ndjson_response(location_data()), 200
+
+        items = list(location_data())
+        next_cursor = scanned['last_id'] if limit is not None and scanned['count'] == limit else None
+        return page_response(items, next_cursor), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        conn.close()
+# How safe an area is, favoring recent observations, optionally at a time of day:
+# /safety_score?latitude=12.97&longitude=77.59&radius=500&hour=22&window=1&half_life_days=30
+@app.route('/safety_score', methods=['GET'])
+def get_safety_score():
+    try:
+        area = parse_area(request.args)
+        hours, since, until, half_life = parse_window_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if area is None:
+        return jsonify({"error": "Pass a bbox or latitude, longitude and radius"}), 400
 
-        return jsonify(location_data), 200
+    try:
+        south, west, north, east, center = area
+        observations = query_observations(get_connection(), (south, west, north, east), hours, since, until)
+        summary = decayed_summary(observations, time_module.time(), half_life, center)
+        summary["hours"] = hours
+        summary["half_life_days"] = half_life / 86400
+        return jsonify(summary), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    if z not in TILE_ZOOMS:
+        return jsonify({"error": f"Tiles are only available for zoom levels {TILE_ZOOMS}"}), 404
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Tile coordinates out of range"}), 404
+
+    etag, tile = tiles.get_tile(z, x, y)
+    response = jsonify(tile)
+    response.set_etag(etag)
+    # Answers 304 Not Modified when the client already has this version of the tile
+    return response.make_conditional(request)
+
 if __name__ == '__main__':
     app.run(host='192.168.131.199', port=5000, debug=True)
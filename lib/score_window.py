@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from db import time_columns
+from geo import haversine_m_array
+
+DEFAULT_HALF_LIFE_DAYS = 30.0
+DEFAULT_HOUR_WINDOW = 1
+
+
+def parse_time_arg(value):
+    # Unix seconds or an ISO-8601 timestamp
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    epoch, _ = time_columns(value)
+    if epoch is None:
+        raise ValueError(f"Invalid time {value!r}, use unix seconds or ISO-8601")
+    return epoch
+
+
+def parse_window_args(args):
+    # Returns (hours, since, until, half_life_seconds) from the query string.
+    # hour=22&window=1 selects observations made between 21:00 and 23:59, wrapping around midnight.
+    hours = None
+    if 'hour' in args:
+        hour = int(args['hour'])
+        window = int(args.get('window', DEFAULT_HOUR_WINDOW))
+        if not 0 <= hour <= 23:
+            raise ValueError("hour must be between 0 and 23")
+        if window < 0:
+            raise ValueError("window must be positive")
+        hours = sorted({(hour + offset) % 24 for offset in range(-window, window + 1)})
+
+    since = parse_time_arg(args['since']) if 'since' in args else None
+    until = parse_time_arg(args['until']) if 'until' in args else None
+
+    half_life_days = float(args.get('half_life_days', DEFAULT_HALF_LIFE_DAYS))
+    if half_life_days <= 0:
+        raise ValueError("half_life_days must be positive")
+    return hours, since, until, half_life_days * 86400
+
+
+def query_observations(conn, area, hours=None, since=None, until=None):
+    # (latitude, longitude, safety_score, time_epoch, hour_of_day) rows as one float array,
+    # using the spatial index for the area and the time columns for the rest.
+    # The R*Tree stores 32-bit floats rounded outwards, so re-check the exact columns.
+    south, west, north, east = area
+    sql = '''
+        SELECT d.latitude, d.longitude, d.safety_score, d.time_epoch, d.hour_of_day
+        FROM location_rtree r
+        JOIN location_data d ON d.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ?
+          AND r.max_lon >= ? AND r.min_lon <= ?
+          AND d.latitude BETWEEN ? AND ?
+          AND d.longitude BETWEEN ? AND ?
+          AND d.time_epoch IS NOT NULL
+    '''
+    params = [south, north, west, east, south, north, west, east]
+    if hours is not None:
+        sql += f" AND d.hour_of_day IN ({','.join('?' * len(hours))})"
+        params += hours
+    if since is not None:
+        sql += ' AND d.time_epoch >= ?'
+        params.append(since)
+    if until is not None:
+        sql += ' AND d.time_epoch <= ?'
+        params.append(until)
+
+    cursor = conn.cursor()
+    cursor.row_factory = None  # Plain tuples convert straight into an array
+    rows = cursor.execute(sql, params).fetchall()
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def decayed_summary(observations, now, half_life, center=None):
+    # Aggregate scores where an observation half_life seconds old counts half as much as one made now
+    if center is not None:
+        latitude, longitude, radius = center
+        distances = haversine_m_array(latitude, longitude, observations[:, 0], observations[:, 1])
+        observations = observations[distances <= radius]
+
+    scores = observations[:, 2]
+    epochs = observations[:, 3]
+    hours = observations[:, 4].astype(np.int64)
+    # Future timestamps count as fresh rather than more than fully
+    ages = np.maximum(now - epochs, 0)
+
+    summary = {
+        "count": len(scores),
+        "weighted_score": None,
+        "mean_score": None,
+        "min_score": None,
+        "effective_count": float(np.exp2(-ages / half_life).sum()),
+        "latest_time": None,
+        "by_hour": [],
+    }
+    if not len(scores):
+        return summary
+
+    # The weighted mean does not change when all weights are scaled, so weigh relative to the
+    # newest observation; that one has weight 1 and old data cannot underflow the total to zero
+    weights = np.exp2(-(ages - ages.min()) / half_life)
+    summary.update(
+        weighted_score=float(np.dot(weights, scores) / weights.sum()),
+        mean_score=float(scores.mean()),
+        min_score=float(scores.min()),
+        latest_time=datetime.fromtimestamp(epochs.max(), timezone.utc).isoformat(),
+    )
+
+    # Same aggregate per hour of the day, for the hours that have observations
+    counts = np.bincount(hours, minlength=24)
+    hour_weights = np.bincount(hours, weights=weights, minlength=24)
+    hour_scores = np.bincount(hours, weights=weights * scores, minlength=24)
+    summary["by_hour"] = [
+        {
+            "hour": hour,
+            "count": int(counts[hour]),
+            "weighted_score": float(hour_scores[hour] / hour_weights[hour]) if hour_weights[hour] > 0 else None,
+        }
+        for hour in np.flatnonzero(counts).tolist()
+    ]
+    return summary
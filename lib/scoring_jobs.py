@@ -0,0 +1,129 @@
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ScoringPipeline:
+    # Runs the safety score and the Gemini report for an image at the same time.
+    # scorer and reporter are plain callables taking an image path, so local stubs can be plugged in.
+    # stream_reporter, if given, yields the report in pieces so jobs can publish partial text.
+    def __init__(self, scorer, reporter, on_result=None, max_workers=4, max_pending=32, max_finished=1000,
+                 stream_reporter=None):
+        self.scorer = scorer
+        self.reporter = reporter
+        self.stream_reporter = stream_reporter
+        self.on_result = on_result
+        self.max_finished = max_finished
+
+        # One pool drives the jobs, the other runs the score next to each job's report
+        self._job_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scoring-job')
+        self._model_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scoring-model')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # Notified on new report text and when jobs finish
+        self._jobs = {}
+        self._finished = OrderedDict()
+
+    def score_image(self, image_path, on_chunk=None):
+        # Returns (safety_score, report), running both model calls concurrently.
+        # on_chunk receives the report text as it is produced when a stream_reporter is set.
+        score_future = self._model_pool.submit(self.scorer, image_path)
+        if on_chunk is not None and self.stream_reporter is not None:
+            chunks = []
+            for chunk in self.stream_reporter(image_path):
+                chunks.append(chunk)
+                on_chunk(chunk)
+            report = ''.join(chunks)
+        else:
+            report = self.reporter(image_path)
+        return score_future.result(), report
+
+    def submit(self, image_path, **fields):
+        # Queue an image for scoring and return its job id without waiting for the models
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Too many images waiting to be scored, try again later")
+
+        job_id = uuid.uuid4().hex
+        job = dict(fields, id=job_id, image_path=image_path, status='queued', partial_report='')
+        with self._lock:
+            self._jobs[job_id] = job
+
+        try:
+            self._job_pool.submit(self._run, job_id)
+        except Exception:
+            with self._lock:
+                del self._jobs[job_id]
+            self._slots.release()
+            raise
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id) or self._finished.get(job_id)
+            return dict(job) if job is not None else None
+
+    def events(self, job_id, timeout=None):
+        # Yields ('report', text) as report text arrives, then ('done', job) or ('failed', job).
+        # Ends without a final event if the job is unknown or nothing changes for timeout seconds.
+        sent = 0
+        while True:
+            with self._changed:
+                job = self._jobs.get(job_id) or self._finished.get(job_id)
+                if job is None:
+                    return
+                while len(job['partial_report']) == sent and job['status'] in ('queued', 'running'):
+                    if not self._changed.wait(timeout):
+                        return
+                text = job['partial_report'][sent:]
+                sent += len(text)
+                finished = job['status'] in ('done', 'failed')
+                snapshot = dict(job)
+
+            if text:
+                yield 'report', text
+            if finished:
+                yield snapshot['status'], snapshot
+                return
+
+    def _append_report(self, job, chunk):
+        with self._changed:
+            job['partial_report'] += chunk
+            self._changed.notify_all()
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+
+        try:
+            safety_score, report = self.score_image(job['image_path'],
+                                                    on_chunk=lambda chunk: self._append_report(job, chunk))
+            result = dict(job, safety_score=safety_score, report=report)
+            if self.on_result is not None:
+                self.on_result(result)
+            update = {'status': 'done', 'safety_score': safety_score, 'report': report}
+        except Exception as e:
+            update = {'status': 'failed', 'error': str(e)}
+        finally:
+            self._slots.release()
+
+        with self._changed:
+            job.update(update)
+            if update['status'] == 'done':
+                job['partial_report'] = job['report']
+            del self._jobs[job_id]
+            self._finished[job_id] = job
+            # Only keep the most recent finished jobs around for status lookups
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+            self._changed.notify_all()
+
+    def shutdown(self, wait=True):
+        self._job_pool.shutdown(wait=wait)
+        self._model_pool.shutdown(wait=wait)
@@ -0,0 +1,157 @@
+import time
+import uuid
+
+from db import get_connection
+from dispatch import PRIORITY_SOS
+
+
+def parse_coordinate(value, limit, name):
+    # None, or value as a float within [-limit, limit]; it ends up in the SMS text, so nothing else gets through
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not -limit <= value <= limit:  # Also false for NaN
+        raise ValueError(f"{name} must be between {-limit} and {limit}")
+    return value
+
+
+class SosFanout:
+    # Sends an SOS to every registered emergency contact of a user at once, as an SMS with the
+    # user's location and as a call, and records the delivery state of each in SQLite.
+    def __init__(self, dispatcher, db_path='sos.db', twiml_url=None, fallback_number=None, calls=True):
+        self.dispatcher = dispatcher
+        self.db_path = db_path
+        self.twiml_url = twiml_url
+        self.fallback_number = fallback_number  # Used when the user has no registered contacts
+        self.calls = calls and bool(twiml_url)
+
+        conn = get_connection(db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS emergency_contacts (
+                user_id TEXT NOT NULL,
+                phone_number TEXT NOT NULL,
+                name TEXT,
+                PRIMARY KEY (user_id, phone_number)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sos_alerts (
+                id TEXT PRIMARY KEY,
+                user_id TEXT,
+                latitude REAL,
+                longitude REAL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sos_deliveries (
+                id TEXT PRIMARY KEY,
+                alert_id TEXT NOT NULL,
+                phone_number TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sid TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS sos_deliveries_alert ON sos_deliveries (alert_id)')
+        conn.commit()
+
+    def set_contacts(self, user_id, contacts):
+        # contacts: [{"phone_number": ..., "name": ...}, ...]; replaces the user's current list
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute('DELETE FROM emergency_contacts WHERE user_id = ?', (user_id,))
+            conn.executemany(
+                'INSERT OR REPLACE INTO emergency_contacts (user_id, phone_number, name) VALUES (?, ?, ?)',
+                [(user_id, contact['phone_number'], contact.get('name')) for contact in contacts]
+            )
+
+    def get_contacts(self, user_id):
+        rows = get_connection(self.db_path).execute(
+            'SELECT phone_number, name FROM emergency_contacts WHERE user_id = ? ORDER BY rowid', (user_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def message(self, latitude, longitude):
+        text = "SOS! I need help."
+        if latitude is not None and longitude is not None:
+            text += f" My location: https://maps.google.com/?q={latitude},{longitude}"
+        return text
+
+    def trigger(self, user_id=None, latitude=None, longitude=None):
+        # Queue an SMS (and a call) to every contact and return the alert id
+        latitude = parse_coordinate(latitude, 90, 'latitude')
+        longitude = parse_coordinate(longitude, 180, 'longitude')
+        numbers = [contact['phone_number'] for contact in self.get_contacts(user_id)] if user_id else []
+        if not numbers and self.fallback_number:
+            numbers = [self.fallback_number]
+        if not numbers:
+            raise ValueError("No emergency contacts registered")
+
+        alert_id = uuid.uuid4().hex
+        now = time.time()
+        deliveries = []
+        for number in numbers:
+            deliveries.append((uuid.uuid4().hex, number, 'sms'))
+            if self.calls:
+                deliveries.append((uuid.uuid4().hex, number, 'call'))
+
+        # Recorded before anything is queued, so the callbacks always find their row
+        conn = get_connection(self.db_path)
+        with conn:
+            conn.execute('INSERT INTO sos_alerts (id, user_id, latitude, longitude, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (alert_id, user_id, latitude, longitude, now))
+            conn.executemany('''
+                INSERT INTO sos_deliveries (id, alert_id, phone_number, kind, status, updated_at)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+            ''', [(delivery_id, alert_id, number, kind, now) for delivery_id, number, kind in deliveries])
+
+        body = self.message(latitude, longitude)
+        for delivery_id, number, kind in deliveries:
+            on_done = self._recorder(delivery_id)
+            if kind == 'sms':
+                self.dispatcher.send_sms(number, body, priority=PRIORITY_SOS, on_done=on_done)
+            else:
+                self.dispatcher.make_call(number, self.twiml_url, priority=PRIORITY_SOS, on_done=on_done)
+        return alert_id
+
+    def _recorder(self, delivery_id):
+        def record(dispatch):
+            conn = get_connection(self.db_path)
+            with conn:
+                conn.execute('''
+                    UPDATE sos_deliveries SET status = ?, attempts = ?, sid = ?, error = ?, updated_at = ?
+                    WHERE id = ?
+                ''', (dispatch.status, dispatch.attempts, dispatch.sid, dispatch.error,
+                      dispatch.finished_at or time.time(), delivery_id))
+        return record
+
+    def status(self, alert_id):
+        conn = get_connection(self.db_path)
+        alert = conn.execute('SELECT * FROM sos_alerts WHERE id = ?', (alert_id,)).fetchone()
+        if alert is None:
+            return None
+
+        deliveries = [dict(row) for row in conn.execute('''
+            SELECT phone_number, kind, status, attempts, sid, error, updated_at
+            FROM sos_deliveries WHERE alert_id = ? ORDER BY rowid
+        ''', (alert_id,))]
+        sent_at = [delivery['updated_at'] for delivery in deliveries if delivery['status'] == 'sent']
+
+        result = dict(alert)
+        result.update(
+            deliveries=deliveries,
+            sent=len(sent_at),
+            failed=sum(1 for delivery in deliveries if delivery['status'] == 'failed'),
+            pending=sum(1 for delivery in deliveries if delivery['status'] not in ('sent', 'failed')),
+            first_contact_seconds=min(sent_at) - alert['created_at'] if sent_at else None,
+        )
+        return result
@@ -0,0 +1,23 @@
+import json
+from flask import Response, stream_with_context
+
+
+def sse_event(data, event=None):
+    # One server-sent event; data is sent as JSON
+    lines = []
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_response(events):
+    # Stream (event, data) pairs to the client as they are produced
+    def generate():
+        for event, data in events:
+            yield sse_event(data, event)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Keep reverse proxies from buffering the stream
+    })
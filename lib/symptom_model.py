@@ -0,0 +1,181 @@
+# Model bundle for the symptom checker (terminal.py).
+#
+#   python symptom_model.py build [--out models/symptom_bundle.joblib]
+#   python symptom_model.py coldstart [--runs 5]
+#
+# `build` trains the decision tree and writes it together with the label encoder, the
+# symptom index and the disease metadata into one versioned joblib file. The server loads
+# that file on its first request. `coldstart` measures how long a fresh process takes to
+# be ready to predict, from the bundle and from the CSVs.
+
+import argparse
+import csv
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn import preprocessing
+from sklearn.model_selection import train_test_split
+from sklearn.tree import DecisionTreeClassifier
+
+BUNDLE_VERSION = 1
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.getenv('SYMPTOM_DATA_DIR', os.path.join(BASE_DIR, 'Data'))
+MASTER_DATA_DIR = os.getenv('SYMPTOM_MASTER_DATA_DIR', os.path.join(BASE_DIR, 'MasterData'))
+BUNDLE_PATH = os.getenv('SYMPTOM_BUNDLE', os.path.join(BASE_DIR, 'models', 'symptom_bundle.joblib'))
+
+
+def getSeverityDict():
+    severityDictionary = dict()
+    with open(os.path.join(MASTER_DATA_DIR, 'Symptom_severity.csv')) as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for row in csv_reader:
+            if len(row) >= 2:
+                try:
+                    severityDictionary[row[0]] = int(row[1])
+                except ValueError:
+                    print(f"Skipping invalid entry: {row}")
+            else:
+                print(f"Skipping incomplete row: {row}")
+    return severityDictionary
+
+
+def getDescription():
+    description_list = dict()
+    with open(os.path.join(MASTER_DATA_DIR, 'symptom_Description.csv')) as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for row in csv_reader:
+            description_list[row[0]] = row[1]
+    return description_list
+
+
+def getprecautionDict():
+    precautionDictionary = dict()
+    with open(os.path.join(MASTER_DATA_DIR, 'symptom_precaution.csv')) as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=',')
+        for row in csv_reader:
+            precautionDictionary[row[0]] = [row[1], row[2], row[3], row[4]]
+    return precautionDictionary
+
+
+def build():
+    # Train the model and collect everything /predict needs
+    training = pd.read_csv(os.path.join(DATA_DIR, 'Training.csv'))
+    cols = training.columns[:-1]
+    x = training[cols].to_numpy()
+    y = training['prognosis']
+
+    # Preprocessing
+    le = preprocessing.LabelEncoder()
+    y = le.fit_transform(y)
+
+    # Train models
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.33, random_state=42)
+    clf = DecisionTreeClassifier().fit(x_train, y_train)
+
+    severityDictionary = getSeverityDict()
+    description_list = getDescription()
+    precautionDictionary = getprecautionDict()
+
+    # Description, precautions and severity of every disease, joined once and indexed by encoded label
+    disease_table = [
+        {
+            "disease": disease,
+            "description": description_list.get(disease, "No description available."),
+            "precautions": precautionDictionary.get(disease, ["No precautions available."]),
+            "severity": severityDictionary.get(disease, 0)
+        }
+        for disease in le.classes_
+    ]
+
+    return {
+        "version": BUNDLE_VERSION,
+        "built_at": time.time(),
+        "clf": clf,
+        "le": le,
+        "symptom_index": pd.Index(cols),  # Column of every symptom in the input vector
+        "disease_table": disease_table,
+        "disease_severity": np.array([entry["severity"] for entry in disease_table]),
+    }
+
+
+def save(bundle, path=BUNDLE_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load(path=BUNDLE_PATH):
+    # Load the bundle, building (and saving) it first if it is missing or from another version
+    if os.path.exists(path):
+        bundle = joblib.load(path)
+        if bundle.get("version") == BUNDLE_VERSION:
+            return bundle
+        print(f"Rebuilding {path}: version {bundle.get('version')} != {BUNDLE_VERSION}")
+
+    bundle = build()
+    save(bundle, path)
+    return bundle
+
+
+_bundle = None
+_bundle_lock = threading.Lock()
+
+
+def get_bundle():
+    # Loaded on first use, once per process
+    global _bundle
+    if _bundle is None:
+        with _bundle_lock:
+            if _bundle is None:
+                _bundle = load()
+    return _bundle
+
+
+def measure_cold_start(runs):
+    # Fresh interpreter each run, so imports are part of the measurement like a real process start.
+    # Returns {mode: [(process seconds, model seconds), ...]}
+    snippet = (
+        "import time, symptom_model; start = time.perf_counter(); symptom_model.{}(); "
+        "print('model-seconds', time.perf_counter() - start)"
+    )
+    results = {}
+    for name, function in (("bundle", "load"), ("csv", "build")):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', snippet.format(function)], cwd=BASE_DIR,
+                                    check=True, capture_output=True, text=True).stdout
+            total = time.perf_counter() - start
+            model = float(output.split('model-seconds')[-1])
+            timings.append((total, model))
+        results[name] = timings
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['build', 'coldstart'])
+    parser.add_argument('--out', default=BUNDLE_PATH)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        save(build(), args.out)
+        print(f"Built {args.out} in {time.perf_counter() - start:.2f}s")
+    else:
+        load()  # Make sure there is a bundle to measure
+        for name, timings in measure_cold_start(args.runs).items():
+            total = statistics.median(t[0] for t in timings) * 1000
+            model = statistics.median(t[1] for t in timings) * 1000
+            print(f"{name:>6}: process start to ready {total:.0f} ms, model load {model:.1f} ms "
+                  f"(median of {len(timings)} runs)")
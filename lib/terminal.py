@@ -1,106 +1,75 @@
 from flask import Flask, request, jsonify
-import pandas as pd
 import numpy as np
-from sklearn import preprocessing
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.model_selection import train_test_split
-import csv
+from scipy import sparse
+import symptom_model
+import metrics
 
 # Initialize Flask app
 app = Flask(__name__)
 from flask_cors import CORS
 CORS(app)
+metrics.instrument(app)
 
-# Read training and testing data
-training = pd.read_csv(r'C:\Users\mukes\Downloads\saro_sodu\lib\Data\Training.csv')
-testing = pd.read_csv(r'C:\Users\mukes\Downloads\saro_sodu\lib\Data\Testing.csv')
-cols = training.columns
-cols = cols[:-1]
-x = training[cols]
-y = training['prognosis']
-
-# Preprocessing
-le = preprocessing.LabelEncoder()
-le.fit(y)
-y = le.transform(y)
-
-# Train models
-x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.33, random_state=42)
-clf1 = DecisionTreeClassifier()
-clf = clf1.fit(x_train, y_train)
-
-# Load the severity, description, and precaution dictionaries
-severityDictionary = dict()
-description_list = dict()
-precautionDictionary = dict()
-
-def getSeverityDict():
-    global severityDictionary
-    with open(r'C:\Users\mukes\Downloads\saro_sodu\lib\MasterData\Symptom_severity.csv') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            if len(row) >= 2:
-                try:
-                    _diction = {row[0]: int(row[1])}
-                    severityDictionary.update(_diction)
-                except ValueError:
-                    print(f"Skipping invalid entry: {row}")
-            else:
-                print(f"Skipping incomplete row: {row}")
-
-def getDescription():
-    global description_list
-    with open(r'C:\Users\mukes\Downloads\saro_sodu\lib\MasterData\symptom_Description.csv') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            _description = {row[0]: row[1]}
-            description_list.update(_description)
-
-def getprecautionDict():
-    global precautionDictionary
-    with open(r'C:\Users\mukes\Downloads\saro_sodu\lib\MasterData\symptom_precaution.csv') as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        for row in csv_reader:
-            _prec = {row[0]: [row[1], row[2], row[3], row[4]]}
-            precautionDictionary.update(_prec)
-
-# Call these functions to populate the dictionaries
-getSeverityDict()
-getDescription()
-getprecautionDict()
+# The model, label encoder, symptom index and disease metadata come from one bundle built by
+# `python symptom_model.py build`; it is loaded on the first request instead of at import time.
+
+CONSULT_ADVICE = "You should take the consultation from doctor."
+PRECAUTION_ADVICE = "It might not be that bad but you should take precautions."
+
+def encode_symptoms(symptom_index, symptom_lists):
+    # One sparse row per symptom list; returns (matrix, unknown symptoms of each list)
+    lengths = np.array([len(symptoms) for symptoms in symptom_lists], dtype=np.int64)
+    flat = [item for symptoms in symptom_lists for item in symptoms]
+    indices = symptom_index.get_indexer(flat) if flat else np.zeros(0, dtype=np.int64)
+
+    unknown = [[] for _ in symptom_lists]
+    if (indices < 0).any():
+        rows = np.repeat(np.arange(len(symptom_lists)), lengths)
+        for row, item in zip(rows[indices < 0], np.asarray(flat, dtype=object)[indices < 0]):
+            unknown[row].append(item)
+
+    indptr = np.concatenate([[0], np.cumsum(lengths)])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices)), np.maximum(indices, 0), indptr),
+        shape=(len(symptom_lists), len(symptom_index))
+    )
+    return matrix, unknown
 
 # Flask endpoint to handle prediction
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
         data = request.get_json()  # Receive input as JSON
+        bundle = symptom_model.get_bundle()
+        symptom_index = bundle["symptom_index"]
         symptoms_exp = data.get('symptoms', [])
         num_days = data.get('days', 0)
 
+        if not isinstance(symptoms_exp, list):
+            return jsonify({"error": "symptoms must be a list"}), 400
+
+        # Look up all symptom columns at once; unknown symptoms come back as -1
+        indices = symptom_index.get_indexer(symptoms_exp)
+        if (indices < 0).any():
+            unknown = [item for item, index in zip(symptoms_exp, indices) if index < 0]
+            return jsonify({"error": "Unknown symptoms", "unknown_symptoms": unknown}), 400
+
         # Generate input vector from symptoms
-        df = pd.read_csv('/Users/thrishalasivakumar/StudioProjects/app24/lib/Data/Training.csv')
-        X = df.iloc[:, :-1]
-        symptoms_dict = {symptom: index for index, symptom in enumerate(X.columns)}
-        input_vector = np.zeros(len(symptoms_dict))
-        for item in symptoms_exp:
-            input_vector[symptoms_dict[item]] = 1
+        input_vector = np.zeros((1, len(symptom_index)))
+        input_vector[0, indices] = 1
 
         # Make the prediction
-        prediction = clf.predict([input_vector])
-        disease = le.inverse_transform(prediction)
+        with metrics.timer('tree_predict'):
+            prediction = bundle["clf"].predict(input_vector)
+        entry = bundle["disease_table"][prediction[0]]
 
         # Check severity and return response
-        severity = severityDictionary.get(disease[0], 0)
-        condition = "You should take the consultation from doctor." if (severity * num_days) / (len(symptoms_exp) + 1) > 13 else "It might not be that bad but you should take precautions."
-        
-        # Get disease description and precautions
-        description = description_list.get(disease[0], "No description available.")
-        precautions = precautionDictionary.get(disease[0], ["No precautions available."])
+        condition = CONSULT_ADVICE if (entry["severity"] * num_days) / (len(symptoms_exp) + 1) > 13 else PRECAUTION_ADVICE
 
         response = {
-            "disease": disease[0],
-            "description": description,
-            "precautions": precautions,
+            "disease": entry["disease"],
+            "description": entry["description"],
+            "precautions": entry["precautions"],
             "condition_advice": condition
         }
 
@@ -109,6 +78,46 @@ def predict():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# Predict many symptom sets with a single clf.predict call
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        data = request.get_json()  # [{"symptoms": [...], "days": n}, ...] or {"items": [...]}
+        bundle = symptom_model.get_bundle()
+        items = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return jsonify({"error": "Expected a list of items"}), 400
+
+        symptom_lists = [item.get('symptoms', []) for item in items]
+        if not all(isinstance(symptoms, list) for symptoms in symptom_lists):
+            return jsonify({"error": "symptoms must be a list"}), 400
+        num_days = np.array([item.get('days', 0) for item in items], dtype=np.float64)
+
+        matrix, unknown = encode_symptoms(bundle["symptom_index"], symptom_lists)
+        valid = np.array([not missing for missing in unknown], dtype=bool)
+
+        results = [{"error": "Unknown symptoms", "unknown_symptoms": missing} for missing in unknown]
+        if valid.any():
+            # Make the predictions and check severity for all valid items at once
+            with metrics.timer('tree_predict'):
+                predictions = bundle["clf"].predict(matrix[valid])
+            lengths = np.array([len(symptoms) for symptoms in symptom_lists])[valid]
+            consult = bundle["disease_severity"][predictions] * num_days[valid] / (lengths + 1) > 13
+
+            for position, prediction, needs_consult in zip(np.flatnonzero(valid), predictions, consult):
+                entry = bundle["disease_table"][prediction]
+                results[position] = {
+                    "disease": entry["disease"],
+                    "description": entry["description"],
+                    "precautions": entry["precautions"],
+                    "condition_advice": CONSULT_ADVICE if needs_consult else PRECAUTION_ADVICE
+                }
+
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 # Run the Flask app
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=3000, debug=True)
@@ -0,0 +1,131 @@
+import math
+import threading
+import time as time_module
+from collections import Counter
+
+from db import time_columns
+
+MAX_LATITUDE = 85.05112878  # Web Mercator cut-off
+
+
+def hour_of_day(time_text):
+    # Hour (0-23) of an ISO-8601 timestamp such as "2025-01-16T12:00:00", or None if it cannot be parsed
+    return time_columns(time_text)[1]
+
+
+def tile_for(latitude, longitude, zoom):
+    # Slippy-map (Web Mercator) tile containing the point
+    n = 2 ** zoom
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom, x, y):
+    # (min_lon, min_lat, max_lon, max_lat) of a tile
+    n = 2 ** zoom
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)
+
+
+class ScoreStats:
+    # count / mean / min of a set of safety scores that supports removing a score again
+    __slots__ = ('count', 'total', 'minimum', 'scores')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.scores = Counter()
+
+    def add(self, score):
+        self.count += 1
+        self.total += score
+        self.scores[score] += 1
+        if self.minimum is None or score < self.minimum:
+            self.minimum = score
+
+    def remove(self, score):
+        self.count -= 1
+        self.total -= score
+        self.scores[score] -= 1
+        if self.scores[score] <= 0:
+            del self.scores[score]
+            if score == self.minimum:
+                self.minimum = min(self.scores) if self.scores else None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.minimum,
+        }
+
+
+class TileAggregator:
+    # Per-tile (zoom/x/y) and per-hour-of-day safety score statistics, updated on every upload.
+    # Every tile carries a version that changes with its statistics, used for ETags.
+    def __init__(self, zooms=range(10, 17)):
+        self.zooms = tuple(zooms)
+        self._lock = threading.Lock()
+        self._tiles = {}  # (z, x, y) -> [version, overall ScoreStats, {hour: ScoreStats}]
+        self._points = {}  # (latitude, longitude, time) -> safety_score currently counted
+        self._epoch = format(int(time_module.time()), 'x')  # Keeps ETags from a previous process from matching
+
+    def observe(self, latitude, longitude, time, safety_score):
+        # Count a new score for this location and time, replacing the one it had before (if any)
+        key = (latitude, longitude, time)
+        hour = hour_of_day(time)
+        with self._lock:
+            previous = self._points.get(key)
+            if previous == safety_score:
+                return
+            self._points[key] = safety_score
+
+            for zoom in self.zooms:
+                x, y = tile_for(latitude, longitude, zoom)
+                tile = self._tiles.get((zoom, x, y))
+                if tile is None:
+                    tile = self._tiles[(zoom, x, y)] = [0, ScoreStats(), {}]
+
+                tile[0] += 1
+                stats = [tile[1]]
+                if hour is not None:
+                    if hour not in tile[2]:
+                        tile[2][hour] = ScoreStats()
+                    stats.append(tile[2][hour])
+
+                for item in stats:
+                    if previous is not None:
+                        item.remove(previous)
+                    item.add(safety_score)
+
+    def rebuild(self, rows):
+        # Recompute everything from (latitude, longitude, time, safety_score) rows, e.g. at startup
+        with self._lock:
+            self._tiles.clear()
+            self._points.clear()
+        for latitude, longitude, time, safety_score in rows:
+            self.observe(latitude, longitude, time, safety_score)
+
+    def get_tile(self, zoom, x, y):
+        # Returns (etag, tile statistics)
+        with self._lock:
+            tile = self._tiles.get((zoom, x, y))
+            version = tile[0] if tile is not None else 0
+            data = {
+                "z": zoom,
+                "x": x,
+                "y": y,
+                "bounds": tile_bounds(zoom, x, y),
+            }
+            if tile is None:
+                data.update(ScoreStats().to_dict(), hours={})
+            else:
+                data.update(tile[1].to_dict(), hours={str(hour): stats.to_dict()
+                                                      for hour, stats in sorted(tile[2].items())})
+        return f"{self._epoch}-{zoom}-{x}-{y}-{version}", data
@@ -1,46 +1,100 @@
-from flask import Flask, jsonify
-from twilio.rest import Client
+from flask import Flask, jsonify, request, url_for
 from dotenv import load_dotenv
 import os
+from auth_token import request_phone_number
+from dispatch import get_dispatcher
+import metrics
+from sos_fanout import SosFanout
 
 app = Flask(__name__)
+metrics.instrument(app)
 
 # Load environment variables
 load_dotenv()
 
-# Get Twilio credentials from .env
-account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-twilio_number = os.getenv('TWILIO_PHONE_NUMBER')
+# Get the SOS recipient from .env (Twilio credentials are read by the dispatcher)
 recipient_number = os.getenv('RECIPIENT_NUMBER')
 twiml_url = os.getenv('TWILIO_TWIML_URL')
 
-# Initialize Twilio client
-client = Client(account_sid, auth_token)
+# Calls and SMS go out through the shared dispatch queue, ahead of any queued OTP messages.
+# RECIPIENT_NUMBER is still alerted when the user has not registered any contacts.
+fanout = SosFanout(
+    get_dispatcher(),
+    db_path=os.getenv('SOS_DB', 'sos.db'),
+    twiml_url=twiml_url,  # TwiML URL for call instructions
+    fallback_number=recipient_number,
+)
 
-def make_sos_call():
-    try:
-        # Make the SOS call using Twilio
-        call = client.calls.create(
-            to=recipient_number,
-            from_=twilio_number,
-            url=twiml_url  # TwiML URL for call instructions
-        )
-        print(f"Call SID: {call.sid}")
-    except Exception as e:
-        print(f"Error making call: {e}")
+def check_owner(user_id):
+    # Contacts and alerts belong to the phone number verified through /verify-otp, which is also the user id.
+    # Returns an error response, or None when the request may go ahead.
+    phone_number = request_phone_number(request)
+    if phone_number is None:
+        return jsonify({'error': 'Verify your phone number first and send its token as "Authorization: Bearer <token>"'}), 401
+    if phone_number != user_id:
+        return jsonify({'error': 'You can only use your own emergency contacts'}), 403
+    return None
+
+@app.route('/contacts/<user_id>', methods=['GET'])
+def get_contacts(user_id):
+    # Other people's phone numbers, so reading them needs the same proof as changing them
+    error = check_owner(user_id)
+    if error is not None:
+        return error
+    return jsonify({'user_id': user_id, 'contacts': fanout.get_contacts(user_id)}), 200
+
+@app.route('/contacts/<user_id>', methods=['PUT', 'POST'])
+def set_contacts(user_id):
+    error = check_owner(user_id)
+    if error is not None:
+        return error
+
+    data = request.get_json(silent=True) or {}
+    contacts = data.get('contacts')
+    if not isinstance(contacts, list) or not all(isinstance(c, dict) and c.get('phone_number') for c in contacts):
+        return jsonify({'error': 'contacts must be a list of {"phone_number", "name"}'}), 400
+
+    fanout.set_contacts(user_id, contacts)
+    return jsonify({'user_id': user_id, 'contacts': fanout.get_contacts(user_id)}), 200
 
 @app.route('/sos', methods=['POST'])
 def sos():
     # Log the incoming request to verify the endpoint is being hit
     print("SOS request received.")
 
+    # Optional JSON body: {"user_id": ..., "latitude": ..., "longitude": ...}
+    data = request.get_json(silent=True) or {}
+
+    # Alerting a user's contacts needs that user's token; without a user_id only RECIPIENT_NUMBER is alerted
+    if data.get('user_id'):
+        error = check_owner(data['user_id'])
+        if error is not None:
+            return error
+
     try:
-        # Trigger the SOS call
-        make_sos_call()
-        return jsonify({'status': 'SOS call triggered successfully'}), 200
+        # Alert every emergency contact at once
+        sos_id = fanout.trigger(data.get('user_id'), data.get('latitude'), data.get('longitude'))
+        return jsonify({'status': 'SOS call triggered successfully', 'sos_id': sos_id,
+                        'status_url': url_for('sos_status', sos_id=sos_id)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Error triggering SOS: {str(e)}'}), 500
 
+@app.route('/sos/<sos_id>', methods=['GET'])
+def sos_status(sos_id):
+    status = fanout.status(sos_id)
+    if status is None:
+        return jsonify({'error': 'SOS not found'}), 404
+    if status['user_id']:
+        error = check_owner(status['user_id'])
+        if error is not None:
+            return error
+    else:
+        # Nobody owns an anonymous alert, so its recipient stays hidden
+        for delivery in status['deliveries']:
+            delivery.pop('phone_number')
+    return jsonify(status), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)